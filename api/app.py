@@ -6,4 +6,7 @@ if __name__ == '__main__':
     port = int(os.getenv("FLASK_PORT", 3000))  # Default to 3000 if not set
     app = create_app()
 
-    app.run(debug=True, port=port)
+    # The reloader runs create_app in a second process, which would start a second inference pool
+    use_reloader = app.config['INFERENCE_WORKERS'] == 0
+
+    app.run(debug=True, port=port, use_reloader=use_reloader)
@@ -1,5 +1,19 @@
-from flask import Flask
+import atexit
+import os
+import tempfile
+import time
+import cv2
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
+from werkzeug.exceptions import LengthRequired, RequestEntityTooLarge
+from .services.backgammon.ModelRegistry import ModelRegistry, DEFAULT_TIERS
+from .services.backgammon.CalibrationStore import CalibrationStore
+from .services.backgammon.ModelWarmup import ModelWarmup
+from .services.backgammon.ResultCache import ResultCache
+from .services.backgammon.InferencePool import InferencePool
+from .services.backgammon.InferenceExecutor import InferenceExecutor, InferenceOverloaded
+from .services.backgammon.PipelineMetrics import METRICS, request_timings
+from .utils.check_upload_size import check_upload_size
 
 def create_app():
     app = Flask(__name__)
@@ -7,6 +21,196 @@ def create_app():
     # Store the root path in the configuration
     app.config['ROOT_PATH'] = app.root_path
 
+    # Model files, relative to the root path
+    full_cfg, full_weights, (full_size, _) = DEFAULT_TIERS["full"]
+    app.config['MODEL_CFG'] = os.getenv("MODEL_CFG", full_cfg)
+    app.config['MODEL_WEIGHTS'] = os.getenv("MODEL_WEIGHTS", full_weights)
+    app.config['MODEL_INPUT_SIZE'] = int(os.getenv("MODEL_INPUT_SIZE", full_size))
+
+    tiny_cfg, tiny_weights, (tiny_size, _) = DEFAULT_TIERS["tiny"]
+    app.config['MODEL_TINY_CFG'] = os.getenv("MODEL_TINY_CFG", tiny_cfg)
+    app.config['MODEL_TINY_WEIGHTS'] = os.getenv("MODEL_TINY_WEIGHTS", tiny_weights)
+    app.config['MODEL_TINY_INPUT_SIZE'] = int(os.getenv("MODEL_TINY_INPUT_SIZE", tiny_size))
+
+    # Default tier for requests without a `model` parameter: full, tiny or cascade
+    app.config['MODEL_TIER'] = os.getenv("MODEL_TIER", "full")
+
+    # Cascade accepts the tiny result only if every dice is at least this confident
+    app.config['CASCADE_MIN_DICE_CONFIDENCE'] = float(os.getenv("CASCADE_MIN_DICE_CONFIDENCE", 0.5))
+    # Cascade stays on tiny once the full model has this many pending forward passes (0 = never)
+    app.config['CASCADE_MAX_QUEUE_DEPTH'] = int(os.getenv("CASCADE_MAX_QUEUE_DEPTH", 0))
+
+    # Maximum number of images sent through the network in one forward pass
+    app.config['BATCH_MAX_SIZE'] = int(os.getenv("BATCH_MAX_SIZE", 8))
+
+    # Coalesce concurrent single-image forward passes into batches
+    app.config['BATCH_SCHEDULER'] = os.getenv("BATCH_SCHEDULER", "0") == "1"
+    app.config['BATCH_MAX_WAIT_MS'] = float(os.getenv("BATCH_MAX_WAIT_MS", 5))
+
+    # Uploads over this size are refused with a 413 before they are read (per frame for /stream)
+    app.config['MAX_UPLOAD_BYTES'] = int(os.getenv("MAX_UPLOAD_BYTES", 32 * 1024 * 1024))
+    # Whole request body of /parse/batch
+    app.config['BATCH_MAX_UPLOAD_BYTES'] = int(os.getenv("BATCH_MAX_UPLOAD_BYTES", 256 * 1024 * 1024))
+
+    # Checked per endpoint from Content-Length, MAX_CONTENT_LENGTH stays unset since its
+    # per-request override needs Flask 3.1
+    app.before_request(check_upload_size)
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def upload_too_large(e):
+        return jsonify({"error": "Upload too large"}), 413
+
+    @app.errorhandler(LengthRequired)
+    def length_required(e):
+        return jsonify({"error": "Multipart uploads need a Content-Length header"}), 411
+
+    # Requests run their inference in a bounded pool and are shed with a 429 once this many
+    # already wait for it (0 = never shed). The micro-batcher can only coalesce passes that run
+    # at once, so with BATCH_SCHEDULER the default concurrency is BATCH_MAX_SIZE
+    default_concurrency = app.config['BATCH_MAX_SIZE'] if app.config['BATCH_SCHEDULER'] else 4
+    app.config['INFERENCE_CONCURRENCY'] = int(os.getenv("INFERENCE_CONCURRENCY", default_concurrency))
+    app.config['INFERENCE_MAX_QUEUE'] = int(os.getenv("INFERENCE_MAX_QUEUE", 64))
+    app.extensions['inference_executor'] = InferenceExecutor(
+        app.config['INFERENCE_CONCURRENCY'], app.config['INFERENCE_MAX_QUEUE']
+    )
+
+    @app.errorhandler(InferenceOverloaded)
+    def inference_overloaded(e):
+        return jsonify({"error": str(e)}), 429, {"Retry-After": str(e.retry_after)}
+
+    # Per-stage latency histograms on /metrics, and a Server-Timing header with each request's stages
+    app.config['METRICS_ENABLED'] = os.getenv("METRICS_ENABLED", "1") == "1"
+    app.config['SERVER_TIMING'] = os.getenv("SERVER_TIMING", "0") == "1"
+    METRICS.enabled = app.config['METRICS_ENABLED']
+    app.extensions['pipeline_metrics'] = METRICS
+
+    @app.before_request
+    def start_request_timings():
+        if METRICS.enabled:
+            g.request_timings, g.request_timings_token = METRICS.track()
+
+    @app.after_request
+    def record_request(response):
+        timings = g.pop('request_timings', None)
+        if timings is not None:
+            endpoint = request.endpoint or "unknown"
+            METRICS.increment("requests_total", endpoint=endpoint, status=response.status_code)
+            # Streamed responses are only timed until their first byte
+            METRICS.observe("request_duration_seconds", time.perf_counter() - timings.start, endpoint=endpoint)
+            if app.config['SERVER_TIMING']:
+                response.headers['Server-Timing'] = timings.header()
+        return response
+
+    @app.teardown_request
+    def stop_request_timings(exception):
+        token = g.pop('request_timings_token', None)
+        if token is not None:
+            request_timings.reset(token)
+
+    # Requests to /parse and /detect may ask for a profile with `X-Profile: 1` or `?profile=1`
+    # (stored in PROFILE_DIR) or `collapsed` (returned), in the collapsed stack format of flame graphs
+    app.config['PROFILING_ENABLED'] = os.getenv("PROFILING_ENABLED", "0") == "1"
+    app.config['PROFILE_DIR'] = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "backgammon-profiles"))
+
+    # Forward passes in this many pre-started worker processes (0 = in the Flask process),
+    # each pinned to its share of the CPUs with INFERENCE_THREADS OpenCV threads (0 = one per CPU)
+    app.config['INFERENCE_WORKERS'] = int(os.getenv("INFERENCE_WORKERS", 0))
+    app.config['INFERENCE_THREADS'] = int(os.getenv("INFERENCE_THREADS", 0))
+    app.config['INFERENCE_PIN_CPUS'] = os.getenv("INFERENCE_PIN_CPUS", "1") == "1"
+    # Shared memory per worker for blobs and outputs, larger ones are pickled
+    app.config['INFERENCE_SHM_BYTES'] = int(os.getenv("INFERENCE_SHM_BYTES", 64 * 1024 * 1024))
+
+    pool = None
+    if app.config['INFERENCE_WORKERS'] > 0:
+        pool = InferencePool(
+            app.config['INFERENCE_WORKERS'],
+            threads=app.config['INFERENCE_THREADS'] or None,
+            pin_cpus=app.config['INFERENCE_PIN_CPUS'],
+            shm_bytes=app.config['INFERENCE_SHM_BYTES'],
+        )
+        atexit.register(pool.close)
+        # The workers own the cores, keep the front end's resizing and warping single threaded
+        cv2.setNumThreads(1)
+
+    # Networks are loaded once per process and shared by all requests
+    full_size = app.config['MODEL_INPUT_SIZE']
+    tiny_size = app.config['MODEL_TINY_INPUT_SIZE']
+    tiers = {
+        "full": (app.config['MODEL_CFG'], app.config['MODEL_WEIGHTS'], (full_size, full_size)),
+        "tiny": (app.config['MODEL_TINY_CFG'], app.config['MODEL_TINY_WEIGHTS'], (tiny_size, tiny_size)),
+    }
+    batching = None
+    if app.config['BATCH_SCHEDULER']:
+        batching = {
+            "max_batch_size": app.config['BATCH_MAX_SIZE'],
+            "max_wait": app.config['BATCH_MAX_WAIT_MS'] / 1000,
+        }
+    app.extensions['model_registry'] = ModelRegistry(
+        app.root_path,
+        tiers=tiers,
+        batching=batching,
+        pool=pool,
+    )
+
+    # Tiers loaded and warmed up before /readyz reports ready: auto, none or a comma separated list
+    app.config['PRELOAD_MODELS'] = os.getenv("PRELOAD_MODELS", "auto")
+    app.config['PRELOAD_BACKGROUND'] = os.getenv("PRELOAD_BACKGROUND", "1") == "1"
+
+    preload = app.config['PRELOAD_MODELS']
+    if preload == "auto":
+        preload_tiers = ["tiny", "full"] if app.config['MODEL_TIER'] == "cascade" else [app.config['MODEL_TIER']]
+    elif preload == "none":
+        preload_tiers = []
+    else:
+        preload_tiers = [tier.strip() for tier in preload.split(",") if tier.strip()]
+
+    # Two-stage parsing: checkers and dices are detected on the board alone, warped into the
+    # template frame, at this network input size (0 = single stage, multiple of 32 otherwise)
+    app.config['RECTIFIED_INPUT_SIZE'] = int(os.getenv("RECTIFIED_INPUT_SIZE", 0))
+    # Tier locating the board for the first stage of uncalibrated requests
+    app.config['RECTIFIED_BOARD_TIER'] = os.getenv("RECTIFIED_BOARD_TIER", "tiny")
+
+    # Tiled parsing of whole photos: tiles along the longest side, each run at the tier's
+    # input size and merged with cross-tile NMS (0 = one letterboxed pass)
+    app.config['TILE_GRID'] = int(os.getenv("TILE_GRID", 0))
+    app.config['TILE_OVERLAP'] = float(os.getenv("TILE_OVERLAP", 0.2))
+
+    app.extensions['model_warmup'] = ModelWarmup(
+        app.extensions['model_registry'], preload_tiers, app.config['RECTIFIED_INPUT_SIZE']
+    )
+    app.extensions['model_warmup'].start(background=app.config['PRELOAD_BACKGROUND'])
+
+    # Default /detect response: json (detections for client side rendering), jpeg, webp or png
+    app.config['DETECT_FORMAT'] = os.getenv("DETECT_FORMAT", "jpeg")
+    # Encoding quality of jpeg/webp (1-100) and side of the rendered image (0 = network input size)
+    app.config['DETECT_QUALITY'] = int(os.getenv("DETECT_QUALITY", 95))
+    app.config['DETECT_PREVIEW_SIZE'] = int(os.getenv("DETECT_PREVIEW_SIZE", 0))
+
+    # Board corners of fixed cameras, referenced by session id on /parse
+    app.config['CALIBRATION_MAX_SESSIONS'] = int(os.getenv("CALIBRATION_MAX_SESSIONS", 1024))
+    app.extensions['calibration_store'] = CalibrationStore(app.config['CALIBRATION_MAX_SESSIONS'])
+
+    # Calibrated frames whose board regions moved less than this many gray levels reuse the
+    # previous result instead of running inference (0 disables change detection)
+    app.config['CHANGE_THRESHOLD'] = float(os.getenv("CHANGE_THRESHOLD", 6))
+
+    # `delta=1` responses only report a position once it was parsed in this many consecutive frames
+    app.config['TRACKER_STABILITY_FRAMES'] = int(os.getenv("TRACKER_STABILITY_FRAMES", 3))
+
+    # Detections cached by upload content, shared by /parse and /detect (0 bytes disables it)
+    app.config['RESULT_CACHE_MAX_BYTES'] = int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    app.config['RESULT_CACHE_TTL'] = float(os.getenv("RESULT_CACHE_TTL", 3600))
+    # Optional directory so cached detections survive worker restarts
+    app.config['RESULT_CACHE_DIR'] = os.getenv("RESULT_CACHE_DIR", "")
+
+    app.extensions['result_cache'] = None
+    if app.config['RESULT_CACHE_MAX_BYTES'] > 0:
+        app.extensions['result_cache'] = ResultCache(
+            app.config['RESULT_CACHE_MAX_BYTES'],
+            app.config['RESULT_CACHE_TTL'],
+            app.config['RESULT_CACHE_DIR'],
+        )
+
     # Enable CORS for the entire app
     CORS(app)
 
@@ -17,6 +221,9 @@ def create_app():
     from .routes import backgammon_routes
     app.register_blueprint(backgammon_routes.bp)
 
+    from .routes import health_routes
+    app.register_blueprint(health_routes.bp)
+
     # Register template routes
     from .routes import template_routes
     app.register_blueprint(template_routes.bp)
@@ -1,114 +1,413 @@
-from flask import request, jsonify, send_file
+from flask import request, jsonify, send_file, current_app, Response, stream_with_context
 import cv2
 import numpy as np
 import io
-from ..utils.resize_and_pad_image import resize_and_pad_image
+import json
+import threading
+from ..utils.resize_and_pad_image import resize_and_pad_image, get_letterbox_params
 from ..utils.filter_and_get_largest_rectangle import filter_and_get_largest_rectangle
 from ..services.backgammon.BackgammonCV import BackgammonCV
 from ..services.backgammon.Detector import Detector
-
-
+from ..services.backgammon.GameParser import GameParser, CASCADE
+from ..services.backgammon.StreamSession import StreamSession
+from ..services.backgammon.GameTracker import GameTracker
+from ..services.backgammon.ImageInput import ImageInput
+from ..services.backgammon.InferenceExecutor import InferenceOverloaded
+from ..services.backgammon.PipelineMetrics import METRICS
+from ..utils.iter_jpeg_frames import iter_jpeg_frames
+from ..utils.read_upload import read_upload
+from ..utils.get_model_registry import get_model_registry
+from ..utils.get_calibration_store import get_calibration_store
+from ..utils.get_result_cache import get_result_cache
+from ..utils.get_inference_executor import get_inference_executor
+from ..utils.profiled import profiled
+
+
+def get_requested_tier():
+    # `model` query/form parameter, falling back to the deployment default
+    return request.values.get('model', current_app.config['MODEL_TIER'])
+
+
+def get_detection_tier():
+    # Endpoints without plausibility checks run the cascade's accurate tier
+    tier = get_requested_tier()
+    return "full" if tier == CASCADE else tier
+
+
+def create_parser():
+    return GameParser(
+        get_model_registry(),
+        min_dice_confidence=current_app.config['CASCADE_MIN_DICE_CONFIDENCE'],
+        max_queue_depth=current_app.config['CASCADE_MAX_QUEUE_DEPTH'],
+        change_threshold=current_app.config['CHANGE_THRESHOLD'],
+        cache=get_result_cache(),
+        rectified_size=current_app.config['RECTIFIED_INPUT_SIZE'],
+        board_tier=current_app.config['RECTIFIED_BOARD_TIER'],
+        tile_grid=current_app.config['TILE_GRID'],
+        tile_overlap=current_app.config['TILE_OVERLAP'],
+    )
+
+
+def wants_delta():
+    # `delta=1` answers with the changes confirmed by the session's GameTracker
+    return request.values.get('delta') == '1'
+
+
+def validate_tier():
+    tier = get_requested_tier()
+    if tier != CASCADE and tier not in get_model_registry().tiers:
+        return jsonify({"error": f"Unknown model tier: {tier}"}), 400
+    return None
+
+
+@profiled
 def parse_image():
-    if 'image' not in request.files:
-        return jsonify({"error": "No image part in the request"}), 400
-
-    image_file = request.files['image']
-
-    if image_file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
+    error = validate_tier()
+    if error:
+        return error
 
-    try:
-        # Read the image into OpenCV format
-        file_bytes = np.frombuffer(image_file.read(), np.uint8)
-        image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-
-        # Resize image if necessary (adjust according to your model's requirements)
-        image = resize_and_pad_image(image, 608)
+    data, error = read_upload()
+    if error:
+        return error
 
-        # Instantiate the Detector
-        p_min = 0.3
-        threshold_nms = 0.3
-        detector = Detector(p_min, threshold_nms)
+    # Calibrated cameras skip board detection
+    calibration = None
+    session_id = request.values.get('session_id')
+    if session_id:
+        calibration = get_calibration_store().get(session_id)
+        if calibration is None:
+            return jsonify({"error": "Unknown session, calibrate the camera first."}), 404
 
-        # Perform detection
-        detector.detect(image)
+    if wants_delta() and calibration is None:
+        return jsonify({"error": "Delta responses need the session_id of a calibrated camera."}), 400
 
-        # Retrieve class_numbers and bounding_boxes
-        class_numbers = detector.class_numbers
-        bounding_boxes = detector.bounding_boxes  # Corrected attribute name
-
-        # Specify the target classes that correspond to the board edges or markers
-        # Adjust these class numbers to match your model's outputs for the board
-        target_classes = [6, 7]  # Example class numbers representing board markers
+    try:
+        # One forward pass per tier gives both the board and the checkers
+        parser = create_parser()
+
+        # Decoded lazily at the scale the network needs, cached uploads never are
+        image = ImageInput(data, target_size=parser.inputSize(get_requested_tier()))
+
+        # Size from the image header, no decoding needed
+        if calibration is not None and calibration.image_size != image.size:
+            return jsonify({"error": "Image size differs from the calibration, calibrate the camera again."}), 409
+
+        changes = None
+        if calibration is not None:
+            # Unchanged boards of a calibrated camera reuse the previous result
+            game_data, tier, changes = get_inference_executor().run(
+                parser.parseIfChanged, image, get_requested_tier(), calibration
+            )
+        else:
+            game_data, tier = get_inference_executor().run(parser.parse, image, get_requested_tier())
 
-        # Use the utility function to filter and get the largest rectangle
-        rectangle = filter_and_get_largest_rectangle(bounding_boxes, class_numbers, target_classes)
+        if game_data is None:
+            return jsonify({"error": "Unable to detect the game board."}), 400
 
-        if rectangle:
-            top_left, bottom_right = rectangle
+        checker_positions, dices = game_data
 
-            # Compute the four corner points of the rectangle
-            x_min, y_min = top_left
-            x_max, y_max = bottom_right
+        if wants_delta():
+            # Only what changed since the last confirmed position of this camera, if anything
+            tracker = calibration.gameTracker(current_app.config['TRACKER_STABILITY_FRAMES'])
+            response = {"event": tracker.update(checker_positions, dices), "sequence": tracker.sequence, "model": tier}
+        else:
+            # Return the positions as a JSON response
+            response = {"checker_positions": checker_positions, "dices": dices, "model": tier}
+        if changes is not None:
+            response["change_detection"] = changes
+        return jsonify(response), 200
 
-            # Define the four corners of the rectangle in the correct order
-            points_homography = [
-                (x_min, y_min),  # Top-left corner
-                (x_max, y_min),  # Top-right corner
-                (x_max, y_max),  # Bottom-right corner
-                (x_min, y_max),  # Bottom-left corner
-            ]
+    except InferenceOverloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
 
-            # Instantiate the BackgammonCV class
-            backgammon_cv = BackgammonCV()
+def parse_batch():
+    """
+    Parses every `image` part of a multipart request with one batched forward pass per
+    BATCH_MAX_SIZE images, streaming one JSON line per image as it is assigned.
+    """
+    error = validate_tier()
+    if error:
+        return error
 
-            # Get the checker positions
-            checker_positions, dices = backgammon_cv.get_game_data(image, points_homography)
+    image_files = [f for f in request.files.getlist('image') if f.filename != '']
 
-            # Return the positions as a JSON response
-            return jsonify({"checker_positions": checker_positions, "dices": dices}), 200
-        else:
-            return jsonify({"error": "Unable to detect the game board."}), 400
+    if not image_files:
+        return jsonify({"error": "No image part in the request"}), 400
 
+    try:
+        registry = get_model_registry()
+        model = registry.get_tier(get_detection_tier())
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    
 
+    input_size = model.input_size[0]
+    max_batch_size = current_app.config['BATCH_MAX_SIZE']
+
+    # Uploaded files are closed once the view returns: keep their encoded bytes (bounded by
+    # BATCH_MAX_UPLOAD_BYTES), decoding waits for the chunk they belong to
+    uploads = [(image_file.filename, image_file.read()) for image_file in image_files]
+
+    def parse_chunk(chunk, start):
+        """:return: JSON lines of the images of one chunk, parsed with one forward pass."""
+        detector = Detector(p_min=0.2, threshold_nms=0.3, model=model)
+        backgammon_cv = BackgammonCV(detector=detector, template=registry.get_template())
+
+        # Decoded one chunk at a time, at most BATCH_MAX_SIZE images are in memory at once
+        images = {}
+        for i, (_, data) in enumerate(chunk, start):
+            try:
+                images[i] = ImageInput(data, target_size=input_size).image
+            except ValueError:
+                pass
+
+        indices = list(images)
+        try:
+            batch_detections = detector.detectBatch([images[i] for i in indices]) if indices else []
+        except Exception as e:
+            batch_detections = [e] * len(indices)
+        del images
+
+        results = dict(zip(indices, batch_detections))
+
+        lines = []
+        for i, (filename, _) in enumerate(chunk, start):
+            line = {"index": i, "filename": filename}
+
+            if i not in results:
+                line["error"] = "Unable to decode the image."
+            elif isinstance(results[i], Exception):
+                line["error"] = str(results[i])
+            else:
+                game_data = backgammon_cv.parseDetections(results[i], p_board=0.3)
+                if game_data is None:
+                    line["error"] = "Unable to detect the game board."
+                else:
+                    line["checker_positions"], line["dices"] = game_data
+            lines.append(line)
+        return lines
+
+    chunks = [(uploads[start:start + max_batch_size], start) for start in range(0, len(uploads), max_batch_size)]
+
+    # Every chunk is one task of the inference executor. The first one is admitted before the
+    # response starts, so an overloaded server answers 429 with Retry-After
+    executor = get_inference_executor()
+    first = executor.submit(parse_chunk, *chunks[0])
+
+    def generate():
+        for n, (chunk, start) in enumerate(chunks):
+            try:
+                lines = first.result() if n == 0 else executor.run(parse_chunk, chunk, start)
+            except InferenceOverloaded as e:
+                # Shed mid-stream: the images of this chunk are reported for the client to retry
+                lines = [
+                    {"index": i, "filename": filename, "error": str(e), "retry_after": e.retry_after}
+                    for i, (filename, _) in enumerate(chunk, start)
+                ]
+            except Exception as e:
+                lines = [{"index": i, "filename": filename, "error": str(e)} for i, (filename, _) in enumerate(chunk, start)]
+
+            for line in lines:
+                yield json.dumps(line) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+# Seconds a finished /stream response waits for its body reader to stop
+STREAM_READER_JOIN_TIMEOUT = 1.0
+
+
+def stream_frames():
+    """
+    Parses a live camera stream: the request body is an MJPEG (or concatenated JPEG) upload
+    and the response streams one JSON line per parsed frame on the same connection. With
+    `delta=1` each line carries the change event confirmed by that frame (or null) instead
+    of the whole position.
+    """
+    error = validate_tier()
+    if error:
+        return error
+
+    calibration = None
+    session_id = request.values.get('session_id')
+    if session_id:
+        calibration = get_calibration_store().get(session_id)
+        if calibration is None:
+            return jsonify({"error": "Unknown session, calibrate the camera first."}), 404
+
+    # Frames are inference tasks like any other request, refuse the stream while the queue is full
+    executor = get_inference_executor()
+    executor.checkCapacity()
+
+    tracker = None
+    if wants_delta():
+        stability = current_app.config['TRACKER_STABILITY_FRAMES']
+        tracker = calibration.gameTracker(stability) if calibration is not None else GameTracker(stability)
+
+    session = StreamSession(create_parser(), get_requested_tier(), calibration, tracker)
+
+    # Frames are read while earlier ones are parsed, only the newest waiting frame is kept
+    body = request.stream
+    # The body is an endless feed (no limit in check_upload_size), MAX_UPLOAD_BYTES bounds each frame
+    max_frame_size = current_app.config['MAX_UPLOAD_BYTES']
+
+    def read():
+        try:
+            for frame_bytes in iter_jpeg_frames(body, max_frame_size=max_frame_size):
+                # Stopped by generate() when the client went away
+                if session.closed:
+                    return
+                session.feed(frame_bytes)
+        finally:
+            session.close()
+
+    reader = threading.Thread(target=read, name="stream-reader", daemon=True)
+    reader.start()
+
+    def generate():
+        try:
+            for frame in session.frames():
+                try:
+                    result = executor.run(session.process, *frame)
+                except InferenceOverloaded as e:
+                    # The frame is dropped, like frames that arrive while the previous one is parsed
+                    result = {"frame": frame[0], "error": str(e), "retry_after": e.retry_after}
+                except Exception as e:
+                    result = {"frame": frame[0], "error": str(e)}
+                yield json.dumps(result) + "\n"
+        finally:
+            # Closed early on disconnect: stop reading the body before the request ends. A reader
+            # blocked on a stalled connection returns once the server drops it.
+            session.close()
+            reader.join(timeout=STREAM_READER_JOIN_TIMEOUT)
+
+    # The reader uses request.stream, keep the request alive until the response is done
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+# Rendered /detect formats: (extension, mimetype, quality flag)
+DETECT_IMAGE_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    "png": (".png", "image/png", None),
+}
+
+
+def get_game_space(detections):
+    # Largest rectangle spanned by the board corner markers (classes 6 and 7)
+    rectangle = filter_and_get_largest_rectangle(
+        detections["bbox"].tolist(), detections["class_number"].tolist(), [6, 7]
+    )
+    # A single marker gives (None, None)
+    return rectangle if rectangle and rectangle[0] is not None else None
+
+
+def serialize_detections(detections, game_space, labels, image_shape, input_size):
+    """
+    Detections as JSON for client side rendering, in pixels of the uploaded image.
+    """
+    ratio, top, left = get_letterbox_params(image_shape, input_size)
+    offset = np.array([left, top])
+
+    bboxes = detections["bbox"].astype(np.float64)
+    bboxes[:, :2] -= offset
+    bboxes = np.rint(bboxes / ratio).astype(int).tolist()
+    centers = np.rint((detections["center"] - offset) / ratio).astype(int).tolist()
+
+    if game_space is not None:
+        game_space = {
+            name: np.rint((np.array(corner) - offset) / ratio).astype(int).tolist()
+            for name, corner in zip(("top_left", "bottom_right"), game_space)
+        }
+
+    return {
+        "image_size": [image_shape[1], image_shape[0]],
+        "detections": [
+            {
+                "class_number": int(class_number),
+                "label": labels[class_number],
+                "confidence": round(float(confidence), 4),
+                "bbox": bbox,
+                "center": center,
+            }
+            for class_number, confidence, bbox, center in zip(
+                detections["class_number"], detections["confidence"], bboxes, centers
+            )
+        ],
+        "game_space": game_space,
+    }
+
+
+@profiled
 def detect_objects():
-    if 'image' not in request.files:
-        return jsonify({"error": "No image part in the request"}), 400
-    
-    image_file = request.files['image']
-    
-    if image_file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
+    """
+    Detects the objects of an image. Returns them drawn on the letterboxed image (format
+    jpeg, webp or png, with `quality` and a `preview_size` side in pixels) or, with
+    format=json, as JSON so clients can draw them over the image they already have.
+    """
+    error = validate_tier()
+    if error:
+        return error
+
+    data, error = read_upload()
+    if error:
+        return error
+
+    output_format = request.values.get('format', current_app.config['DETECT_FORMAT']).lower()
+    if output_format != "json" and output_format not in DETECT_IMAGE_FORMATS:
+        return jsonify({"error": f"Unknown format: {output_format}"}), 400
 
     try:
-        # Read the image into OpenCV format
-        file_bytes = np.frombuffer(image_file.read(), np.uint8)
-        image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-        
-        # Resize image for the model
-        image = resize_and_pad_image(image, 608)
-
-        # Detect checkers on the image
-        p_min = 0.3
-        threshold_nms = 0.3
-        detector = Detector(p_min, threshold_nms)
+        quality = int(request.values.get('quality', current_app.config['DETECT_QUALITY']))
+        preview_size = int(request.values.get('preview_size', current_app.config['DETECT_PREVIEW_SIZE']))
+    except ValueError:
+        return jsonify({"error": "quality and preview_size must be integers"}), 400
 
-        results, class_numbers, confidences, bounding_boxes, centers = detector.detect(image)
+    try:
+        tier = get_detection_tier()
+        model = get_model_registry().get_tier(tier)
+        input_size = model.input_size[0]
 
-        # At least one detection should exist, draw results on the image
-        image = detector.drawResult()
+        # Detect checkers on the image, sharing cached detections with /parse
+        parser = create_parser()
+        source = ImageInput(data, target_size=input_size)
+        detections, _ = get_inference_executor().run(parser.detect, tier, source)
 
-        # Specify the target classes (for example, class 7 and class 6)
-        target_classes = [6, 7]
+        # Same result as detecting at p_min directly, NMS only suppresses in favour of higher scores
+        p_min = 0.3
+        detections = detections[detections["confidence"] > p_min]
+
+        game_space = get_game_space(detections)
+
+        if output_format == "json":
+            # Nothing to draw or encode, and cached uploads are not even decoded
+            response = serialize_detections(detections, game_space, model.labels, source.shape, input_size)
+            response["model"] = tier
+            return jsonify(response), 200
+
+        # Resize image for the model, or straight to the smaller preview
+        size = min(preview_size, input_size) if preview_size > 0 else input_size
+        image = source.image  # Decoded first, decoding has its own stage
+        with METRICS.stage("render"):
+            image = resize_and_pad_image(image, size)
+
+        if size != input_size:
+            scale = size / input_size
+            detections = detections.copy()
+            detections["bbox"] = np.rint(detections["bbox"] * scale)
+            detections["center"] = np.rint(detections["center"] * scale)
+            if game_space is not None:
+                game_space = [tuple(int(round(v * scale)) for v in corner) for corner in game_space]
 
-        # Use the utility function to filter and get the largest rectangle
-        rectangle = filter_and_get_largest_rectangle(bounding_boxes, class_numbers, target_classes)
+        # At least one detection should exist, draw results on the image
+        detector = Detector(p_min, parser.threshold_nms, model=model)
+        with METRICS.stage("render"):
+            image = detector.drawResult(image, detections, copy=False)
 
-        if rectangle:
-            top_left, bottom_right = rectangle
+        if game_space is not None:
+            top_left, bottom_right = game_space
             # Draw the rectangle on the image
             cv2.rectangle(image, top_left, bottom_right, (0, 255, 0), 2)
 
@@ -131,11 +430,32 @@ def detect_objects():
             cv2.putText(image, label, (label_x, label_y), font, font_scale, font_color, thickness)
 
         # Encode the modified image to return as response
-        _, buffer = cv2.imencode('.jpg', image)
+        extension, mimetype, quality_flag = DETECT_IMAGE_FORMATS[output_format]
+        params = [quality_flag, min(max(quality, 1), 100)] if quality_flag is not None else []
+        with METRICS.stage("encode"):
+            _, buffer = cv2.imencode(extension, image, params)
         image_io = io.BytesIO(buffer)
 
         # Return the image as a response
-        return send_file(image_io, mimetype='image/jpeg')
+        return send_file(image_io, mimetype=mimetype)
 
+    except InferenceOverloaded:
+        raise
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+
+def get_cache():
+    # Hit/miss counters and size of the detection cache
+    cache = get_result_cache()
+    return jsonify(cache.stats() if cache is not None else {"enabled": False}), 200
+
+
+def get_queue():
+    # Depth of the inference queue and how many requests were shed
+    return jsonify(get_inference_executor().stats()), 200
+
+
+def get_models():
+    # Loaded networks with their load time and memory footprint
+    return jsonify(get_model_registry().stats()), 200
@@ -0,0 +1,73 @@
+from flask import request, jsonify, current_app
+import json
+from ..services.backgammon.GameParser import GameParser
+from ..services.backgammon.ImageInput import ImageInput
+from ..services.backgammon.InferenceExecutor import InferenceOverloaded
+from ..utils.read_upload import read_upload, RAW_UPLOAD_MIMETYPES
+from ..utils.get_model_registry import get_model_registry
+from ..utils.get_calibration_store import get_calibration_store
+from ..utils.get_inference_executor import get_inference_executor
+
+
+def create_calibration():
+    """
+    Registers the board corners of a fixed camera.
+
+    Either send an `image` to detect the corners once, or `corners` (JSON list of 4 [x, y]
+    in original image pixels) together with `image_width` and `image_height`. An optional
+    `session_id` re-calibrates an existing session.
+    """
+    session_id = request.values.get('session_id') or None
+
+    try:
+        if 'corners' in request.values:
+            corners = json.loads(request.values['corners'])
+            image_size = (int(request.values['image_width']), int(request.values['image_height']))
+        elif 'image' in request.files or request.mimetype in RAW_UPLOAD_MIMETYPES:
+            data, error = read_upload()
+            if error:
+                return error
+
+            tier = request.values.get('model', current_app.config['MODEL_TIER'])
+            parser = GameParser(get_model_registry())
+            image = ImageInput(data, target_size=parser.inputSize(tier))
+            try:
+                corners = get_inference_executor().run(parser.findCorners, image, tier)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if corners is None:
+                return jsonify({"error": "Unable to detect the game board."}), 400
+
+            # Corners are in original pixels even when the image was decoded at a reduced scale
+            image_size = image.size
+        else:
+            return jsonify({"error": "Send either an image or corners with image_width/image_height"}), 400
+
+        calibration = get_calibration_store().register(corners, image_size, session_id)
+
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid calibration: {e}"}), 400
+    except InferenceOverloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify(calibration.toDict()), 201
+
+
+def get_calibration(session_id):
+    calibration = get_calibration_store().get(session_id)
+    if calibration is None:
+        return jsonify({"error": "Unknown session"}), 404
+    return jsonify(calibration.toDict()), 200
+
+
+def list_calibrations():
+    return jsonify({"calibrations": [c.toDict() for c in get_calibration_store().all()]}), 200
+
+
+def delete_calibration(session_id):
+    # The camera moved, later requests must calibrate again
+    if not get_calibration_store().invalidate(session_id):
+        return jsonify({"error": "Unknown session"}), 404
+    return jsonify({"session_id": session_id, "invalidated": True}), 200
@@ -0,0 +1,43 @@
+import os
+from flask import Response, jsonify
+from ..utils.get_model_warmup import get_model_warmup
+from ..utils.get_pipeline_metrics import get_pipeline_metrics
+from ..utils.get_inference_executor import get_inference_executor
+from ..utils.get_model_registry import get_model_registry
+from ..utils.get_result_cache import get_result_cache
+from ..utils.get_rss_bytes import get_rss_bytes
+
+
+def healthz():
+    # The process is up and serving requests
+    return jsonify({"status": "ok"}), 200
+
+
+def readyz():
+    # Only ready once the configured models are loaded and warmed up
+    warmup = get_model_warmup()
+    return jsonify(warmup.toDict()), 200 if warmup.isReady() else 503
+
+
+def metrics():
+    # Stage latencies and request counts, plus the current state of the queues and caches
+    executor = get_inference_executor().stats()
+    samples = [
+        ("gauge", "inference_queue_depth", {}, executor["queue_depth"]),
+        ("gauge", "inference_running", {}, executor["running"]),
+        ("counter", "inference_rejected_total", {}, executor["rejected"]),
+        ("gauge", "rss_bytes", {}, get_rss_bytes()),
+    ]
+
+    for model in list(get_model_registry().models.values()):
+        labels = {"weights": os.path.basename(model.weights_path), "input_size": model.input_size[0]}
+        samples.append(("gauge", "model_pending", labels, model.pending))
+
+    cache = get_result_cache()
+    if cache is not None:
+        cache_stats = cache.stats()
+        samples.append(("gauge", "result_cache_bytes", {}, cache_stats["bytes"]))
+        for name in ("hits", "disk_hits", "misses", "evictions"):
+            samples.append(("counter", f"result_cache_{name}_total", {}, cache_stats[name]))
+
+    return Response(get_pipeline_metrics().render(samples), mimetype="text/plain; version=0.0.4")
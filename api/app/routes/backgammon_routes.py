@@ -1,4 +1,4 @@
-from ..controllers import backgammon_controller
+from ..controllers import backgammon_controller, calibration_controller
 from flask import Blueprint
 
 bp = Blueprint('backgammon', __name__, url_prefix='/api/backgammon')
@@ -7,6 +7,42 @@ bp = Blueprint('backgammon', __name__, url_prefix='/api/backgammon')
 def parse_image():
     return backgammon_controller.parse_image()
 
+@bp.route('/parse/batch', methods=['POST'])
+def parse_batch():
+    return backgammon_controller.parse_batch()
+
+@bp.route('/stream', methods=['POST'])
+def stream():
+    return backgammon_controller.stream_frames()
+
 @bp.route('/detect', methods=['POST'])
 def detect():
     return backgammon_controller.detect_objects()
+
+@bp.route('/cache', methods=['GET'])
+def cache():
+    return backgammon_controller.get_cache()
+
+@bp.route('/queue', methods=['GET'])
+def queue():
+    return backgammon_controller.get_queue()
+
+@bp.route('/models', methods=['GET'])
+def models():
+    return backgammon_controller.get_models()
+
+@bp.route('/calibrations', methods=['POST'])
+def create_calibration():
+    return calibration_controller.create_calibration()
+
+@bp.route('/calibrations', methods=['GET'])
+def list_calibrations():
+    return calibration_controller.list_calibrations()
+
+@bp.route('/calibrations/<session_id>', methods=['GET'])
+def get_calibration(session_id):
+    return calibration_controller.get_calibration(session_id)
+
+@bp.route('/calibrations/<session_id>', methods=['DELETE'])
+def delete_calibration(session_id):
+    return calibration_controller.delete_calibration(session_id)
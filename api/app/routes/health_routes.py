@@ -0,0 +1,16 @@
+from flask import Blueprint
+from ..controllers import health_controller
+
+bp = Blueprint('health', __name__)
+
+@bp.route('/healthz', methods=['GET'])
+def healthz():
+    return health_controller.healthz()
+
+@bp.route('/readyz', methods=['GET'])
+def readyz():
+    return health_controller.readyz()
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    return health_controller.metrics()
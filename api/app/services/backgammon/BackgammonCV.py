@@ -1,23 +1,23 @@
 # Importing the necessary modules
-from ...services.backgammon.BoardPosition import BoardPosition
-from ...services.backgammon.Dice import Dice
 from ...services.backgammon.Board import Board
-from ...services.backgammon.Color import Color
+from ...services.backgammon.BoardState import BoardState
 from ...services.backgammon.Detector import Detector
-from ...services.backgammon.Disk import Disk
 from ...services.backgammon.Point import Point
 from ...services.backgammon.Class import Class
+from ...services.backgammon.PointLabelMap import PointLabelMap
+from ...services.backgammon.BoardGeometry import BoardGeometry
+from ...services.backgammon.PipelineMetrics import METRICS
 from ...utils.get_full_path import get_full_path
+from ...utils.filter_and_get_largest_rectangle import filter_and_get_largest_rectangle
 import cv2
 import numpy as np
-from shapely.geometry import Point as ShapelyPoint, Polygon
 from ...services.backgammon.Constants import POINT_BBOXS, POINT_CENTERS, NUM_POINTS, NUM_POINT_HOMOGRAPHY
 
 
 class BackgammonCV:
-    def __init__(self):
+    def __init__(self, detector=None, template=None):
         self.template_aligned = False
-        self.detector = Detector(p_min=0.2, threshold_nms=0.3)
+        self.detector = detector if detector is not None else Detector(p_min=0.2, threshold_nms=0.3)
 
         self.template = []
         self.template_width = 0
@@ -28,13 +28,29 @@ class BackgammonCV:
         self.points_template = []
         self.points_homography = []
         self.transformation_matrix = []
+        self.inverse_matrix = []
+        self.point_labels = None
 
         self.point_centers = POINT_CENTERS
         self.point_bboxs = POINT_BBOXS
 
         self.board = Board()
 
-        self.loadTemplate()
+        if template is not None:
+            self.useTemplate(template)
+        else:
+            self.loadTemplate()
+
+    def useTemplate(self, template):
+        """
+        Uses a template already read by the ModelRegistry instead of reading it from disk.
+
+        :param template: ModelRegistry.Template instance.
+        """
+        self.template = template.image
+        self.template_height, self.template_width = template.height, template.width
+        self.points_template = list(template.points)
+        self.point_labels = PointLabelMap.forTemplate(self.template_width, self.template_height)
 
     def loadTemplate(self):
         self.template = cv2.imread(get_full_path("data/images/template.jpg"))
@@ -45,6 +61,7 @@ class BackgammonCV:
             (self.template_width, self.template_height),
             (0, self.template_height),
         ]
+        self.point_labels = PointLabelMap.forTemplate(self.template_width, self.template_height)
 
     def get_game_data(self, image, points_homography):
         """
@@ -54,11 +71,91 @@ class BackgammonCV:
         :param points_homography: List of 4 points [(x, y), ...] defining the corners of the board in the image.
         :return: Dictionary mapping positions to list of checkers.
         """
+        self.align(points_homography)
 
+        # Now perform detection
+        checker_positions, dices = self.detect(image)
+
+        return checker_positions, dices
+
+    def parse(self, image, p_board=0.3):
+        """
+        Parses the game from a single forward pass of the detector.
+
+        The detector runs once at its own (lowest) threshold, the board corners are taken from
+        the detections above `p_board` and the checkers/dices from all of them. NMS only ever
+        suppresses a box in favour of a higher scoring one, so re-thresholding after NMS gives
+        the same board as a separate pass at `p_board` would.
+
+        :param image: The image of the backgammon board, already resized for the network.
+        :param p_board: Minimum confidence of the detections used to find the board corners.
+        :return: (checker_positions, dices), or None if the board could not be found.
+        """
         self.frame = image
         self.image_height, self.image_width, _ = self.frame.shape
 
-        self.points_homography = points_homography
+        detections = self.detector.detect(self.frame)
+
+        return self.parseDetections(detections, p_board)
+
+    def parseDetections(self, detections, p_board=0.3):
+        """
+        Same as parse() for detections that were already computed, e.g. by Detector.detectBatch.
+
+        :param detections: Structured array returned by the detector.
+        :param p_board: Minimum confidence of the detections used to find the board corners.
+        :return: (checker_positions, dices), or None if the board could not be found.
+        """
+        points_homography = self.findBoard(detections, p_board)
+        if points_homography is None:
+            return None
+
+        self.align(points_homography)
+
+        return self.assign(detections)
+
+    def findBoard(self, detections, p_board=0.3):
+        """
+        Finds the four corners of the board from the board marker detections.
+
+        :param detections: Structured array returned by Detector.detect.
+        :param p_board: Minimum confidence of the markers.
+        :return: List of 4 points [(x, y), ...] or None if no marker passed `p_board`.
+        """
+        markers = detections[detections["confidence"] >= p_board]
+
+        with METRICS.stage("find_board"):
+            rectangle = filter_and_get_largest_rectangle(
+                markers["bbox"].tolist(), markers["class_number"].tolist(), Class.BOARD_MARKERS
+            )
+        if not rectangle or rectangle[0] is None:
+            return None
+
+        (x_min, y_min), (x_max, y_max) = rectangle
+
+        # Define the four corners of the rectangle in the correct order
+        return [
+            (x_min, y_min),  # Top-left corner
+            (x_max, y_min),  # Top-right corner
+            (x_max, y_max),  # Bottom-right corner
+            (x_min, y_max),  # Bottom-left corner
+        ]
+
+    def align(self, points_homography):
+        """
+        Warps the template points onto the board described by the 4 corners.
+
+        :param points_homography: List of 4 points [(x, y), ...] defining the corners of the board in the image.
+        """
+        self.useGeometry(BoardGeometry(self.points_template, points_homography, self.point_bboxs))
+
+    def useGeometry(self, geometry):
+        """
+        Aligns the template with a precomputed BoardGeometry, e.g. from a calibration.
+
+        :param geometry: BoardGeometry instance.
+        """
+        self.points_homography = geometry.points_homography
 
         # Set board bbox to the homography points
         self.board.bbox = self.points_homography.copy()
@@ -67,33 +164,14 @@ class BackgammonCV:
         self.board.points = []  # Reset points
         for i in range(len(self.point_bboxs)):
             point = Point((i + 1), self.point_centers[i], bbox=self.point_bboxs[i])
+            point.bbox_warped = geometry.bboxs_warped[i]
             self.board.addPoint(point)
 
-        # MATRIX TRANSFORM --------------------------------------------------------------
-
-        # Find matrix
-        source = np.asarray(self.points_template, dtype=np.float32)
-        destination = np.asarray(self.points_homography, dtype=np.float32)
-        self.transformation_matrix = cv2.getPerspectiveTransform(source, destination)
-
-        # Apply transformation to all point's bbox
-        for point in self.board.points:
-            point.bbox_warped = np.asarray(point.bbox, dtype=np.float32)
-            point.bbox_warped = point.bbox_warped.reshape((-1, 1, 2))
-
-            point.bbox_warped = cv2.perspectiveTransform(
-                point.bbox_warped, self.transformation_matrix
-            )
-
-            point.bbox_warped = np.array(point.bbox_warped, dtype=np.int32)
+        self.transformation_matrix = geometry.transformation_matrix
+        self.inverse_matrix = geometry.inverse_matrix
 
         self.template_aligned = True
 
-        # Now perform detection
-        checker_positions, dices = self.detect(image)
-
-        return checker_positions, dices
-
     def detect(self, image):
         if not self.template_aligned:
             print(
@@ -103,72 +181,50 @@ class BackgammonCV:
 
         self.frame = image
 
-        self.board.clear()
-
         self.image_height, self.image_width, _ = self.frame.shape
 
-        results, class_numbers, confidences, bounding_boxes, centers = self.detector.detect(self.frame)
-
-        # Generate objects from detection ---------------------------------------------------------------
-        for i in range(len(centers)):
-
-            # DISK WHITE
-            if class_numbers[i] == Class.DISK_WHITE:
-                newDisk = Disk(
-                    centers[i], confidences[i], Color.WHITE
-                )
-                self.board.addDisk(newDisk)
-
-            # DISK BLACK
-            if class_numbers[i] == Class.DISK_BLACK:
-                newDisk = Disk(
-                    centers[i], confidences[i], Color.BLACK
-                )
-                self.board.addDisk(newDisk)
-
-            # DICE
-            if self.detector.class_numbers[i] < Class.DISKS:
-                newDice = Dice(self.detector.class_numbers[i], self.detector.centers[i], self.detector.confidences[i])
+        detections = self.detector.detect(self.frame)
 
-                # Dice position binarization
-                if newDice.center[0] >= self.board.getBar().bbox_warped[0][0][0]:
-                    newDice.board_position = BoardPosition.RIGHT
-                else:
-                    newDice.board_position = BoardPosition.LEFT
+        return self.assign(detections)
 
-                self.board.addDice(newDice)
+    def assign(self, detections):
+        """
+        Places the detected checkers and dices on the aligned board.
 
-        # Checkers positions --------------------------------------------------------------
-        checker_positions = {str(i): [] for i in range(1, 25)}  # Dictionary to hold the results
+        :param detections: Structured array returned by Detector.detect.
+        :return: (checker_positions, dices)
+        """
+        with METRICS.stage("point_lookup"):
+            point_ids, on_board, right_side = self.lookup(detections)
 
-        # Loop through each point on the board
-        for index, point in enumerate(self.board.points):
-            position = str(index + 1)  # Convert index + 1 to string to match dictionary keys
+        with METRICS.stage("assign"):
+            return self.__assign(detections, point_ids, on_board, right_side)
 
-            # Loop through each disk in the point
-            for disk in point.disks:
-                # Determine the checker label based on the disk color
-                checker_label = "player_1" if disk.color == Color.WHITE else "player_2"
+    def lookup(self, detections):
+        """
+        Looks every detection center up in template space at once.
 
-                # Add the checker label to the corresponding position
-                checker_positions[position].append(checker_label)
+        :return: Arrays of the point id, on board flag and right side flag of every detection
+        """
+        if len(detections) > 0:
+            template_centers = cv2.perspectiveTransform(
+                detections["center"].astype(np.float32).reshape((-1, 1, 2)), self.inverse_matrix
+            ).reshape((-1, 2))
+        else:
+            template_centers = np.empty((0, 2), dtype=np.float32)
 
-        # Dices --------------------------------------------------------------
-        dices = [{"value": int(dice.value), "confidence": float(dice.confidence)} for dice in self.board.dices]
+        point_ids = self.point_labels.lookup(template_centers)
+        on_board = self.point_labels.contains(template_centers)
+        # Left edge of the bar in template space
+        right_side = template_centers[:, 0] >= self.point_bboxs[-1][0][0]
 
-        return checker_positions, dices
+        return point_ids, on_board, right_side
 
-    def pointInPoly(self, point, polygon):
-        """
-        Check if a point is inside a polygon.
+    def __assign(self, detections, point_ids, on_board, right_side):
+        # Checkers counted per point and dices kept in a few arrays, the Board objects are views of them
+        self.board.state = BoardState.fromDetections(detections, point_ids, on_board, right_side)
 
-        :param point: Tuple (x, y).
-        :param polygon: List of tuples [(x1, y1), (x2, y2), ...].
-        :return: True if the point is inside the polygon, False otherwise.
-        """
-        shapely_point = ShapelyPoint(point)
-        shapely_polygon = Polygon(polygon)
-        return shapely_polygon.contains(shapely_point)
+        return self.board.state.checkerPositions(), self.board.state.diceList()
 
 # Example usage:
 if __name__ == "__main__":
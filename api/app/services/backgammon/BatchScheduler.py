@@ -0,0 +1,97 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from ...utils.histogram import Histogram
+from ...utils.split_batch_outputs import split_batch_outputs
+
+
+class BatchScheduler:
+    """
+    Coalesces single-image forward passes from concurrent requests into batches.
+
+    A worker thread takes the first queued blob, waits up to `max_wait` seconds for more
+    (or until `max_batch_size` blobs are queued), runs one forward pass on all of them and
+    resolves each request's future with its own slice of the output.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_wait=0.005):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.queue = queue.Queue()
+
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64])
+        self.queue_waits = Histogram([0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0])
+
+        self.thread = threading.Thread(target=self.__run, name="batch-scheduler", daemon=True)
+        self.thread.start()
+
+    def submit(self, blob):
+        """
+        Queues a single-image blob for the next batch.
+
+        :param blob: NCHW blob with N == 1, as built by cv2.dnn.blobFromImage.
+        :return: Future resolving to the list of YOLO layer outputs for this image.
+        """
+        if blob.shape[0] != 1:
+            raise ValueError("BatchScheduler expects single-image blobs")
+
+        future = Future()
+        self.queue.put((blob, future, time.perf_counter()))
+        return future
+
+    def forward(self, blob):
+        return self.submit(blob).result()
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def __collect(self):
+        first = self.queue.get()
+        batch = [first]
+
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    # Out of time, but still take whatever is already waiting
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def __run(self):
+        while True:
+            batch = self.__collect()
+
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_waits.observe(started - enqueued)
+            self.batch_sizes.observe(len(batch))
+
+            try:
+                blob = np.concatenate([item[0] for item in batch])
+                network_output = self.model.run(blob)
+
+                for (_, future, _), image_output in zip(batch, split_batch_outputs(network_output, len(batch))):
+                    future.set_result(image_output)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self.depth(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_seconds": self.queue_waits.snapshot(),
+        }
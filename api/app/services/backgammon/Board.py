@@ -1,11 +1,55 @@
-from ...utils.point_in_poly import point_in_poly
+import numpy as np
+from .BoardPosition import BoardPosition
+from .BoardState import BoardState
+from .Class import Class
+from .Color import Color
+from .Detector import DETECTION_DTYPE
+from .Dice import Dice
+from .Disk import Disk
+
 
 class Board:
+    """
+    The aligned board: its points and their geometry, plus the BoardState of the last parse.
+
+    `disks`, `dices` and the disks of every point are views built from the state on access,
+    the state itself is a few arrays that are cheap to copy, compare and keep in a history.
+    """
+
+    __slots__ = ("bbox", "points", "state")
+
     def __init__(self):
         self.bbox = []
         self.points = []
-        self.dices = []
-        self.disks = []  # Initialize self.disks
+        self.state = BoardState.empty()
+
+    @property
+    def disks(self):
+        detections = self.state.detections
+        rows = np.flatnonzero(detections["class_number"] >= Class.DISKS).tolist()
+        return [self.__disk(detections[row]) for row in rows]
+
+    @property
+    def dices(self):
+        detections = self.state.detections
+        return [
+            Dice(
+                int(detections[row]["class_number"]),
+                tuple(detections[row]["center"].tolist()),
+                float(detections[row]["confidence"]),
+                BoardPosition.RIGHT if right else BoardPosition.LEFT,
+            )
+            for row, right in zip(self.state.dice_rows.tolist(), self.state.dice_right.tolist())
+        ]
+
+    def disksOn(self, point_id):
+        detections = self.state.detections
+        return [self.__disk(detections[row]) for row in np.flatnonzero(self.state.point_ids == point_id).tolist()]
+
+    @staticmethod
+    def __disk(detection):
+        color = Color.WHITE if detection["class_number"] == Class.DISK_WHITE else Color.BLACK
+        return Disk(tuple(detection["center"].tolist()), float(detection["confidence"]), color)
 
     def reset(self):
         self.clear()
@@ -13,25 +57,34 @@ class Board:
             point.reset()
 
     def clear(self):
-        for point in self.points:
-            point.clear()
-        self.dices.clear()
-        self.disks.clear()  # Clear the disks list
+        self.state = BoardState.empty()
 
     def addPoint(self, point):
+        point.board = self
         self.points.append(point)
 
-    def addDice(self, dice):
-        # Check if the detected dice is on the board
-        if point_in_poly(dice.center, self.bbox):
-            self.dices.append(dice)
+    def addDice(self, dice, on_board):
+        # Whether the dice is on the board is looked up by the caller
+        if on_board:
+            self.state = self.state.withDetection(
+                self.__detection(dice.id, dice.center, dice.confidence),
+                right_side=dice.board_position == BoardPosition.RIGHT,
+            )
 
-    def addDisk(self, disk):
-        self.disks.append(disk)  # Add the disk to the disks list
-        # Determine correct point to add
-        for point in self.points:
-            if point_in_poly(disk.center, point.bbox_warped):
-                point.addDisk(disk)
+    def addDisk(self, disk, point_id):
+        # Point already looked up by the caller, 0 meaning the disk is on no point
+        class_number = Class.DISK_WHITE if disk.color == Color.WHITE else Class.DISK_BLACK
+        self.state = self.state.withDetection(
+            self.__detection(class_number, disk.center, disk.confidence), point_id
+        )
+
+    @staticmethod
+    def __detection(class_number, center, confidence):
+        detection = np.zeros((), dtype=DETECTION_DTYPE)
+        detection["class_number"] = class_number
+        detection["confidence"] = confidence
+        detection["center"] = center
+        return detection
 
     def getBar(self):
         return self.points[-1]  # Get the last point, assuming it's the bar
@@ -49,8 +102,6 @@ class Board:
         board = Board()
         board.bbox = self.bbox.copy()
         for point in self.points:
-            newPoint = point.copy()
-            board.addPoint(newPoint)
-        board.dices = self.dices.copy()
-        board.disks = self.disks.copy()  # Copy the disks list
+            board.addPoint(point.copy())
+        board.state = self.state.copy()
         return board
@@ -0,0 +1,95 @@
+import threading
+import cv2
+import numpy as np
+from .PointLabelMap import PointLabelMap
+
+
+class BoardChangeDetector:
+    """
+    Tells whether the board region of a frame changed since the last parsed frame.
+
+    The board is warped from the calibrated corners into a small grayscale copy of the
+    template frame and compared region by region (each point, the bar and the open area
+    where dices land) with the frame that produced the cached result. If no region moved
+    by more than `threshold` gray levels on average, the cached result is still valid.
+    """
+
+    def __init__(self, template_size, threshold=6.0, width=128, working_size=512):
+        self.threshold = threshold
+        self.working_size = working_size
+
+        template_width, template_height = template_size
+        self.size = (width, max(int(round(width * template_height / template_width)), 1))
+        self.points_small = np.float32(
+            [(0, 0), (self.size[0], 0), (self.size[0], self.size[1]), (0, self.size[1])]
+        )
+
+        # Point ids at signature resolution, 0 being the area outside every point
+        labels = PointLabelMap.forTemplate(template_width, template_height).labels
+        self.regions = cv2.resize(labels, self.size, interpolation=cv2.INTER_NEAREST).ravel()
+        self.region_sizes = np.maximum(np.bincount(self.regions), 1)
+
+        self.reference = None
+        self.result = None
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.last_inference_time = 0.0
+        self.saved_time = 0.0
+
+    def signature(self, image, corners):
+        """
+        :param image: Original frame.
+        :param corners: 4 board corners in original frame pixels.
+        :return: Small blurred grayscale image of the board in template orientation.
+        """
+        # Shrink first so the warp averages sensor noise instead of sampling it
+        scale = min(self.working_size / max(image.shape[:2]), 1.0)
+        if scale < 1.0:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        source = np.float32(corners) * scale
+        matrix = cv2.getPerspectiveTransform(source, self.points_small)
+        board = cv2.warpPerspective(gray, matrix, self.size, flags=cv2.INTER_LINEAR)
+
+        return cv2.GaussianBlur(board, (3, 3), 0)
+
+    def difference(self, signature):
+        """Largest mean absolute difference of any region against the reference."""
+        diff = cv2.absdiff(signature, self.reference).ravel()
+        region_means = np.bincount(self.regions, weights=diff, minlength=len(self.region_sizes))
+        return float((region_means[: len(self.region_sizes)] / self.region_sizes).max())
+
+    def lookup(self, image, corners):
+        """
+        :return: (cached result or None, signature of the frame to pass to update())
+        """
+        signature = self.signature(image, corners)
+
+        with self.lock:
+            if self.result is not None and self.difference(signature) <= self.threshold:
+                self.hits += 1
+                self.saved_time += self.last_inference_time
+                return self.result, signature
+
+            self.misses += 1
+            return None, signature
+
+    def update(self, signature, result, inference_time):
+        """Stores the result of a frame that was parsed because it changed."""
+        with self.lock:
+            self.reference = signature
+            self.result = result
+            self.last_inference_time = inference_time
+
+    def stats(self, unchanged):
+        total = self.hits + self.misses
+        return {
+            "unchanged": unchanged,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "saved_inference_ms": round(self.saved_time * 1000, 2),
+        }
@@ -0,0 +1,43 @@
+import functools
+import cv2
+import numpy as np
+from .Constants import POINT_BBOXS
+from .PipelineMetrics import METRICS
+
+
+class BoardGeometry:
+    """
+    Homography between the template and a board in an image, plus every point's bbox
+    warped into the image.
+
+    Depends only on the 4 board corners, so it can be computed once and reused for every
+    frame of a fixed camera.
+    """
+
+    def __init__(self, points_template, points_homography, point_bboxs=POINT_BBOXS):
+        self.points_template = [tuple(p) for p in points_template]
+        self.points_homography = [tuple(p) for p in points_homography]
+
+        with METRICS.stage("homography"):
+            # Find matrix
+            source = np.asarray(self.points_template, dtype=np.float32)
+            destination = np.asarray(self.points_homography, dtype=np.float32)
+            self.transformation_matrix = cv2.getPerspectiveTransform(source, destination)
+            self.inverse_matrix = np.linalg.inv(self.transformation_matrix)
+
+            # Warp the bboxs of all points in one call
+            bboxs = np.asarray(point_bboxs, dtype=np.float32)
+            warped = cv2.perspectiveTransform(bboxs.reshape((-1, 1, 2)), self.transformation_matrix)
+            self.bboxs_warped = warped.reshape((len(point_bboxs), -1, 1, 2)).astype(np.int32)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def forRectified(template_width, template_height, width, height):
+        """
+        Geometry of a board already warped into the template frame at width x height pixels,
+        a plain scaling computed once per size.
+        """
+        return BoardGeometry(
+            [(0, 0), (template_width, 0), (template_width, template_height), (0, template_height)],
+            [(0, 0), (width, 0), (width, height), (0, height)],
+        )
@@ -0,0 +1,182 @@
+import functools
+import numpy as np
+from .Class import Class
+from .Color import Color
+from .Detector import DETECTION_DTYPE
+
+# Rows of the count array: points 1-24 at 0-23, then the bar and the borne off checkers
+BAR = 24
+OFF = 25
+CHECKERS_PER_PLAYER = 15
+
+PLAYER_LABELS = {Color.WHITE: "player_1", Color.BLACK: "player_2"}
+
+
+def read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+class BoardState:
+    """
+    Immutable snapshot of a parsed board, a handful of small arrays instead of an object graph.
+
+    `counts` holds checkers per point and color, shape (26, 2) indexed by point - 1 (BAR
+    for the bar, OFF for borne off checkers, i.e. those of 15 not seen on the board) and
+    Color value. `detections` are the checkers and dices the state was built from, with
+    `point_ids` the point of every checker (0 for dices and checkers on no point), and
+    `dices` the values of the dices on the board in detection order.
+
+    The arrays are read-only, so copies share them. Equality and hashing only look at the
+    position (counts and dice values), two frames of the same position compare equal.
+    """
+
+    __slots__ = ("counts", "detections", "point_ids", "dices", "dice_rows", "dice_right")
+
+    def __init__(self, counts, detections, point_ids, dices, dice_rows, dice_right):
+        # Takes ownership of the arrays, except detections which stay writable for the caller
+        self.counts = read_only(counts)
+        self.detections = read_only(detections.view())
+        self.point_ids = read_only(point_ids)
+        self.dices = read_only(dices)
+        # Row in detections and side of the bar of each dice
+        self.dice_rows = read_only(dice_rows)
+        self.dice_right = read_only(dice_right)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def empty():
+        return BoardState.fromDetections(
+            np.empty(0, dtype=DETECTION_DTYPE), np.empty(0, dtype=np.int8), np.empty(0, dtype=bool), np.empty(0, dtype=bool)
+        )
+
+    @staticmethod
+    def fromDetections(detections, point_ids, on_board, right_side):
+        """
+        :param detections: Structured array returned by the detector.
+        :param point_ids: Point 1-25 of every detection, 0 outside every point.
+        :param on_board: Whether every detection is inside the board.
+        :param right_side: Whether every detection is right of the bar.
+        """
+        class_numbers = detections["class_number"]
+        white = class_numbers == Class.DISK_WHITE
+        disks = class_numbers >= Class.DISKS
+
+        point_ids = np.where(disks, point_ids, 0).astype(np.int8)
+
+        # Flat index (point - 1) * 2 + Color value, WHITE == 1, checkers on no point land in OFF
+        slots = np.where(point_ids > 0, point_ids - 1, OFF) * 2 + white
+        counts = np.bincount(slots[disks], minlength=(OFF + 1) * 2).astype(np.uint8).reshape(OFF + 1, 2)
+        counts[OFF] = np.maximum(CHECKERS_PER_PLAYER - counts[:OFF].sum(axis=0, dtype=np.int32), 0)
+
+        dice_rows = np.flatnonzero((class_numbers < Class.DISKS) & np.asarray(on_board, dtype=bool))
+        dices = (class_numbers[dice_rows] + 1).astype(np.uint8)
+
+        return BoardState(
+            counts, detections, point_ids, dices, dice_rows, np.asarray(right_side, dtype=bool)[dice_rows]
+        )
+
+    def withDetection(self, detection, point_id=0, on_board=True, right_side=False):
+        """Same state with one more detection, for the object API adding disks and dices one by one."""
+        detections = np.append(self.detections, np.asarray(detection, dtype=DETECTION_DTYPE))
+        point_ids = np.append(self.point_ids, point_id)
+
+        on_board_flags = np.zeros(len(detections), dtype=bool)
+        on_board_flags[self.dice_rows] = True
+        on_board_flags[-1] = on_board
+        right_flags = np.zeros(len(detections), dtype=bool)
+        right_flags[self.dice_rows] = self.dice_right
+        right_flags[-1] = right_side
+
+        return BoardState.fromDetections(detections, point_ids, on_board_flags, right_flags)
+
+    def withPointCleared(self, point_id):
+        """
+        Same state with the checkers of a point on no point: they leave the point's count but
+        stay in the detections, as Point.clear() never removed them from Board.disks.
+        """
+        point_ids = np.where(self.point_ids == point_id, 0, self.point_ids)
+        on_board = np.zeros(len(self.detections), dtype=bool)
+        on_board[self.dice_rows] = True
+        right_side = np.zeros(len(self.detections), dtype=bool)
+        right_side[self.dice_rows] = self.dice_right
+
+        return BoardState.fromDetections(self.detections, point_ids, on_board, right_side)
+
+    def copy(self):
+        # Read-only arrays, nothing to duplicate
+        return BoardState(self.counts, self.detections, self.point_ids, self.dices, self.dice_rows, self.dice_right)
+
+    def key(self):
+        """Bytes identifying the position, dices in any order."""
+        return self.counts.tobytes() + np.sort(self.dices).tobytes()
+
+    def __eq__(self, other):
+        return isinstance(other, BoardState) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def toBytes(self):
+        """Position only: 52 bytes of counts followed by one byte per dice."""
+        return self.counts.tobytes() + self.dices.tobytes()
+
+    @staticmethod
+    def fromBytes(data):
+        """State of toBytes() output, without detections."""
+        counts = np.frombuffer(data, dtype=np.uint8, count=(OFF + 1) * 2).reshape(OFF + 1, 2).copy()
+        dices = np.frombuffer(data, dtype=np.uint8, offset=counts.nbytes).copy()
+        return BoardState(
+            counts, np.empty(0, dtype=DETECTION_DTYPE), np.empty(0, dtype=np.int8), dices,
+            np.empty(0, dtype=np.intp), np.zeros(len(dices), dtype=bool),
+        )
+
+    @staticmethod
+    def fromGameData(checker_positions, dices):
+        """State of a parse result (checker_positions and dices), without detections."""
+        counts = np.zeros((OFF + 1, 2), dtype=np.uint8)
+        for point, players in checker_positions.items():
+            whites = players.count(PLAYER_LABELS[Color.WHITE])
+            counts[int(point) - 1] = (len(players) - whites, whites)
+        counts[OFF] = np.maximum(CHECKERS_PER_PLAYER - counts[:OFF].sum(axis=0, dtype=np.int32), 0)
+
+        values = np.array([dice["value"] for dice in dices], dtype=np.uint8)
+        return BoardState(
+            counts, np.empty(0, dtype=DETECTION_DTYPE), np.empty(0, dtype=np.int8), values,
+            np.empty(0, dtype=np.intp), np.zeros(len(values), dtype=bool),
+        )
+
+    def checkerPositions(self):
+        """
+        :return: {"1": ["player_1", ...], ..., "25": [...]}, checkers of a point in detection
+            order, or white first for states without detections.
+        """
+        positions = {str(i): [] for i in range(1, BAR + 2)}
+
+        if len(self.detections) == 0:
+            for index in np.flatnonzero(self.counts[:OFF].any(axis=1)).tolist():
+                positions[str(index + 1)] = (
+                    [PLAYER_LABELS[Color.WHITE]] * int(self.counts[index, Color.WHITE])
+                    + [PLAYER_LABELS[Color.BLACK]] * int(self.counts[index, Color.BLACK])
+                )
+            return positions
+
+        labels = [PLAYER_LABELS[Color.BLACK], PLAYER_LABELS[Color.WHITE]]
+        whites = (self.detections["class_number"] == Class.DISK_WHITE).tolist()
+        for point_id, white in zip(self.point_ids.tolist(), whites):
+            if point_id > 0:
+                positions[str(point_id)].append(labels[white])
+        return positions
+
+    def diceList(self):
+        """:return: [{"value": 1-6, "confidence": float or None}, ...]"""
+        confidences = self.detections["confidence"][self.dice_rows].tolist()
+        if len(confidences) < len(self.dices):
+            confidences = [None] * len(self.dices)
+        return [
+            {"value": value, "confidence": confidence}
+            for value, confidence in zip(self.dices.tolist(), confidences)
+        ]
+
+    def toDict(self):
+        return {"checker_positions": self.checkerPositions(), "dices": self.diceList()}
@@ -0,0 +1,128 @@
+import threading
+import time
+import uuid
+from .BoardGeometry import BoardGeometry
+from .BoardChangeDetector import BoardChangeDetector
+from .GameTracker import GameTracker
+from ...utils.resize_and_pad_image import get_letterbox_params
+
+
+class Calibration:
+    """
+    Board corners of a fixed camera, in pixels of the original (not letterboxed) frames.
+
+    The BoardGeometry for each network input size is computed on first use and reused by
+    every later request of the session.
+    """
+
+    def __init__(self, session_id, corners, image_size):
+        self.session_id = session_id
+        self.corners = [(float(x), float(y)) for x, y in corners]
+        self.image_size = tuple(image_size)  # (width, height)
+        self.created_at = time.time()
+        self.last_used_at = None
+        self.uses = 0
+
+        self.geometries = {}
+        self.change_detector = None
+        self.game_tracker = None
+        self.lock = threading.Lock()
+
+    def markUsed(self):
+        """Counts a parse of the camera, keeping the calibration recent for the store's LRU."""
+        with self.lock:
+            self.uses += 1
+            self.last_used_at = time.time()
+
+    def geometryFor(self, input_size, points_template):
+        """
+        :param input_size: Side of the square letterboxed network input.
+        :param points_template: Corners of the template.
+        :return: BoardGeometry in letterboxed image coordinates.
+        """
+        geometry = self.geometries.get(input_size)
+        if geometry is None:
+            width, height = self.image_size
+            ratio, top, left = get_letterbox_params((height, width), input_size)
+            points_homography = [(x * ratio + left, y * ratio + top) for x, y in self.corners]
+
+            geometry = BoardGeometry(points_template, points_homography)
+            with self.lock:
+                self.geometries[input_size] = geometry
+
+        return geometry
+
+    def changeDetector(self, template_size, threshold):
+        """Returns the BoardChangeDetector of this camera, created on first use."""
+        if self.change_detector is None:
+            with self.lock:
+                if self.change_detector is None:
+                    self.change_detector = BoardChangeDetector(template_size, threshold)
+        return self.change_detector
+
+    def gameTracker(self, stability):
+        """Returns the GameTracker of this camera, created on first use."""
+        if self.game_tracker is None:
+            with self.lock:
+                if self.game_tracker is None:
+                    self.game_tracker = GameTracker(stability)
+        return self.game_tracker
+
+    def toDict(self):
+        return {
+            "session_id": self.session_id,
+            "corners": [list(corner) for corner in self.corners],
+            "image_size": list(self.image_size),
+            "created_at": self.created_at,
+            "last_used_at": self.last_used_at,
+            "uses": self.uses,
+            "game_tracker": self.game_tracker.stats() if self.game_tracker is not None else None,
+        }
+
+
+class CalibrationStore:
+    """In-memory calibrations by session id, shared by all requests of the process."""
+
+    def __init__(self, max_sessions=1024):
+        self.max_sessions = max_sessions
+        self.calibrations = {}
+        self.lock = threading.Lock()
+
+    def register(self, corners, image_size, session_id=None):
+        """
+        Stores (or replaces) the calibration of a camera.
+
+        :param corners: 4 board corners [(x, y), ...] in original image pixels: top-left,
+            top-right, bottom-right, bottom-left.
+        :param image_size: (width, height) of the camera frames.
+        :param session_id: Id to register under, a new one is generated when omitted.
+        :return: Calibration instance.
+        """
+        if len(corners) != 4:
+            raise ValueError("A calibration needs exactly 4 corners")
+
+        calibration = Calibration(session_id or uuid.uuid4().hex, corners, image_size)
+
+        with self.lock:
+            if calibration.session_id not in self.calibrations and len(self.calibrations) >= self.max_sessions:
+                # Drop the least recently used session
+                oldest = min(
+                    self.calibrations.values(),
+                    key=lambda c: c.last_used_at or c.created_at,
+                )
+                del self.calibrations[oldest.session_id]
+
+            self.calibrations[calibration.session_id] = calibration
+
+        return calibration
+
+    def get(self, session_id):
+        return self.calibrations.get(session_id)
+
+    def invalidate(self, session_id):
+        """Forgets a calibration, e.g. after the camera moved. Returns False if it did not exist."""
+        with self.lock:
+            return self.calibrations.pop(session_id, None) is not None
+
+    def all(self):
+        return list(self.calibrations.values())
@@ -13,3 +13,6 @@ class Class:
     DISK_WHITE = 6
     DISK_BLACK = 7
     DISKS = DISK_WHITE
+
+    # Classes whose outermost detections span the playing area
+    BOARD_MARKERS = [DISK_WHITE, DISK_BLACK]
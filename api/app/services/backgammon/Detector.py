@@ -2,10 +2,27 @@ import os
 import numpy as np
 import cv2
 from .Constants import CLASS_COLORS
+from .ModelRegistry import Model
+from .PipelineMetrics import METRICS
 from app.utils.get_full_path import get_full_path
+from app.utils.split_batch_outputs import split_batch_outputs
+from app.utils.get_tile_windows import get_tile_windows
+
+# One row per detection, in pixels of the image passed to Detector.detect
+DETECTION_DTYPE = np.dtype(
+    [
+        ("class_number", np.int32),
+        ("confidence", np.float32),
+        ("bbox", np.int32, (4,)),  # x_min, y_min, width, height
+        ("center", np.int32, (2,)),
+    ]
+)
+
+# Network input pixels from a tile edge within which a box counts as cut by it
+TILE_EDGE_MARGIN = 2
 
 class Detector:
-    def __init__(self, p_min=0.5, threshold_nms=0.3):
+    def __init__(self, p_min=0.5, threshold_nms=0.3, model=None):
         self.p_min = p_min
         self.threshold_nms = threshold_nms
         self.image = 0
@@ -17,40 +34,39 @@ class Detector:
         self.network = 0
         self.layers = 0
         self.network_output = 0
-        self.results = 0
-        self.bounding_boxes = []
-        self.confidences = []
-        self.class_numbers = []
-        self.centers = []
+        self.letterbox = (1.0, 0, 0)
+        self.results = []
+        self.detections = np.empty(0, dtype=DETECTION_DTYPE)
+        self.bounding_boxes = self.detections["bbox"]
+        self.confidences = self.detections["confidence"]
+        self.class_numbers = self.detections["class_number"]
+        self.centers = self.detections["center"]
 
         self.image_size = (608, 608)
 
+        # Prefer a model shared through the ModelRegistry, loading our own is slow
+        self.model = model if model is not None else self.__loadModel()
         self.__load()
 
+    def __loadModel(self):
+        return Model(
+            get_full_path("data/cfg/yolov4.cfg"),
+            get_full_path("data/cfg/yolov4.weights"),
+            self.image_size,
+            get_full_path("data/cfg/coco.names"),
+        )
+
     def __load(self):
-        self.__loadLabels()
+        self.labels = self.model.labels
         # self.__loadColors()
-        self.__loadNetwork()
-
-    def __loadLabels(self):
-        with open(get_full_path("data/cfg/coco.names")) as f:
-            self.labels = [line.strip() for line in f]
-        # time.sleep(2)
+        self.network = self.model.network
+        self.layers = self.model.layers
+        self.image_size = self.model.input_size
 
     # def __loadColors(self):
     # colors = np.random.randint(0, 255, size=(len(self.labels), 3), dtype="uint8")
     # self.colors = colors
 
-    def __loadNetwork(self):
-        self.network = cv2.dnn.readNetFromDarknet(
-            get_full_path("data/cfg/yolov4.cfg"),
-            get_full_path("data/cfg/yolov4.weights"),
-        )
-        self.layers = self.network.getLayerNames()
-        self.layers = [
-            self.layers[i - 1] for i in self.network.getUnconnectedOutLayers()
-        ]
-
     def loadImage(self, image):
         self.image = image
         self.height, self.width = self.image.shape[:2]
@@ -59,166 +75,255 @@ class Detector:
         )
 
     def detect(self, image):
+        """
+        :param image: Image of any size, letterboxed to the network input on the way.
+        :return: Detections in pixels of `image`.
+        """
         # print("Detecting...")
-        self.loadImage(image)
-        self.network.setInput(self.blob)
-        self.network_output = self.network.forward(self.layers)
-
-        temp_class_numbers = []
-        temp_confidences = []
-        temp_bounding_boxes = []
-        self.centers = []
-
-        temp_class_numbers = []
-
-        # Going through all output layers after feed forward pass
-        for result in self.network_output:
-            for detected_objects in result:
-                scores = detected_objects[5:]
-                class_current = np.argmax(scores)
-                confidence_current = scores[class_current]
-
-                if confidence_current > self.p_min:
-                    box_current = detected_objects[0:4] * np.array(
-                        [self.width, self.height, self.width, self.height]
-                    )
-
-                    x_center, y_center, box_width, box_height = box_current
-                    x_min = int(x_center - (box_width / 2))
-                    y_min = int(y_center - (box_height / 2))
-
-                    # Adding results into prepared lists
-                    temp_bounding_boxes.append(
-                        [x_min, y_min, int(box_width), int(box_height)]
-                    )
-                    temp_confidences.append(float(confidence_current))
-                    temp_class_numbers.append(class_current)
-
-        self.results = cv2.dnn.NMSBoxes(
-            temp_bounding_boxes, temp_confidences, self.p_min, self.threshold_nms
-        )
-
-        if len(self.results) > 0:
-
-            self.class_numbers = []
-            self.bounding_boxes = []
-            self.confidences = []
+        ratio, top, left = self.__forward(image)
 
-            for i in self.results.flatten():
-
-                x_min, y_min = temp_bounding_boxes[i][0], temp_bounding_boxes[i][1]
-                box_width, box_height = (
-                    temp_bounding_boxes[i][2],
-                    temp_bounding_boxes[i][3],
-                )
-                x_center = x_min + box_width // 2
-                y_center = y_min + box_height // 2
-
-                self.centers.append((x_center, y_center))
-                self.class_numbers.append(temp_class_numbers[i])
-                self.bounding_boxes.append(temp_bounding_boxes[i])
-                self.confidences.append(temp_confidences[i])
+        # Normalized network coordinates straight back to the original image
+        size = self.image_size[0] / ratio
+        self.detections = self.decode(self.network_output, size, size, (left / ratio, top / ratio))
+        self.__setColumns()
 
         # print("Detection complete\n")
 
+        return self.detections
+
+    def detectInLetterbox(self, image):
+        """
+        Same as detect(), with detections in pixels of the letterboxed network input instead,
+        i.e. of resize_and_pad_image(image, input size) without ever building that image.
+        """
+        self.__forward(image)
+        self.detections = self.decode(self.network_output, *self.image_size)
+        self.__setColumns()
+        return self.detections
+
+    def detectTiled(self, image, grid=2, overlap=0.2, include_full=True):
+        """
+        Detects on overlapping tiles of the image, so small objects such as dices keep more
+        pixels than in one letterboxed pass. All tiles go through the network as one batch.
+
+        :param image: Image of any size, ideally larger than grid x the network input.
+        :param grid: Number of tiles along the longest side.
+        :param overlap: Fraction of a tile shared with its neighbours, so an object cut by the
+            border of one tile is whole in the next one.
+        :param include_full: Also run the whole image, for objects larger than a tile.
+        :return: Detections in pixels of `image`, merged across tiles with class-aware NMS
+            after dropping the boxes cut by an inner tile edge.
+        """
+        self.image = image
+        self.height, self.width = self.image.shape[:2]
+
+        windows = get_tile_windows(image.shape, grid, overlap)
+        if include_full:
+            windows.append((0, 0, self.width, self.height))
+
+        preprocessor = self.model.preprocessor
+        with preprocessor.acquire(len(windows)) as buffers:
+            letterboxes = [
+                preprocessor.preprocess(image[y:y + h, x:x + w], buffers, i)[1]
+                for i, (x, y, w, h) in enumerate(windows)
+            ]
+            self.network_output = self.model.forward(buffers.blob[:len(windows)])
+
+        # Each tile back to global pixels, tile by tile NMS already done by decode()
+        parts = []
+        for window, (ratio, top, left), output in zip(
+            windows, letterboxes, split_batch_outputs(self.network_output, len(windows))
+        ):
+            size = self.image_size[0] / ratio
+            tile_detections = self.decode(output, size, size, (left / ratio - window[0], top / ratio - window[1]))
+            parts.append(tile_detections[~self.__touchesInnerEdge(tile_detections["bbox"], window, TILE_EDGE_MARGIN / ratio)])
+        detections = np.concatenate(parts)
+
+        # Cross-tile NMS, overlapping tiles see the same objects
+        keep = self.nms(
+            np.ascontiguousarray(detections["bbox"]),
+            np.ascontiguousarray(detections["confidence"]),
+            detections["class_number"],
+        )
+        self.detections = detections[keep]
+        self.__setColumns()
+        return self.detections
+
+    def __touchesInnerEdge(self, bounding_boxes, window, margin):
+        """
+        Boxes reaching a tile edge that is not an image edge, i.e. objects the tile cut. The
+        overlap makes them whole in a neighbouring tile, and a cut box keeps too little IoU
+        with the whole one for NMS to merge them.
+        """
+        x, y, w, h = window
+        x_min, y_min = bounding_boxes[:, 0], bounding_boxes[:, 1]
+        x_max, y_max = x_min + bounding_boxes[:, 2], y_min + bounding_boxes[:, 3]
         return (
-            self.results,
-            self.class_numbers,
-            self.confidences,
-            self.bounding_boxes,
-            self.centers,
+            ((x > 0) & (x_min <= x + margin))
+            | ((y > 0) & (y_min <= y + margin))
+            | ((x + w < self.width) & (x_max >= x + w - margin))
+            | ((y + h < self.height) & (y_max >= y + h - margin))
         )
 
-    def drawResult(self):
-        image = self.image.copy()
-        if len(self.results) > 0:
-            for i in range(len(self.bounding_boxes)):
-
-                # Getting current bounding box coordinates, its width and height
-                # x_center, y_center = centers[i]
-                # print(centers[i])
-                x_min, y_min = self.bounding_boxes[i][0], self.bounding_boxes[i][1]
-                box_width, box_height = (
-                    self.bounding_boxes[i][2],
-                    self.bounding_boxes[i][3],
-                )
-                x_center, y_center = self.centers[i]
-
-                # Preparing colour for current bounding box
-                colour_box_current = self.colors[self.class_numbers[i]].tolist()
-
-                # Drawing bounding box on the original image
-                cv2.rectangle(
-                    image,
-                    (x_min, y_min),
-                    (x_min + box_width, y_min + box_height),
-                    colour_box_current,
-                    1,
-                )
-                if self.class_numbers[i] >= 6:
-                    cv2.circle(image, (x_center, y_center), 2, (255, 255, 255), 2)
-
-                # Preparing text with label and confidence for current bounding box
-                text_box_current = "{}: {:.2f}".format(
-                    self.labels[int(self.class_numbers[i])], self.confidences[i]
-                )
-
-                # Putting text with label and confidence on the original image
-                cv2.putText(
-                    image,
-                    text_box_current,
-                    (x_min, y_min - 5),
-                    cv2.FONT_HERSHEY_DUPLEX,
-                    0.4,
-                    colour_box_current,
-                    1,
-                    cv2.LINE_AA,
-                )
-        return image
+    def __forward(self, image):
+        self.image = image
+        self.height, self.width = self.image.shape[:2]
+
+        preprocessor = self.model.preprocessor
+        with preprocessor.acquire() as buffers:
+            blob, self.letterbox = preprocessor.preprocess(image, buffers)
+            # Coalesced with other requests into one batched forward pass when batching is enabled
+            self.network_output = self.model.forward(blob)
+
+        return self.letterbox
+
+    def __setColumns(self):
+        # Column views kept for the drawing helpers and older callers
+        self.class_numbers = self.detections["class_number"]
+        self.confidences = self.detections["confidence"]
+        self.bounding_boxes = self.detections["bbox"]
+        self.centers = self.detections["center"]
+
+    def detectBatch(self, images):
+        """
+        Letterboxes several images into one pooled blob and runs them through a single forward pass.
+
+        :param images: List of images of any size.
+        :return: List of detection arrays in pixels of the letterboxed network input, one per
+            image, in the same order.
+        """
+        preprocessor = self.model.preprocessor
+        with preprocessor.acquire(len(images)) as buffers:
+            for i, image in enumerate(images):
+                preprocessor.preprocess(image, buffers, i)
+            network_output = self.model.forward(buffers.blob[:len(images)])
+
+        return [
+            self.decode(image_output, *self.image_size)
+            for image_output in split_batch_outputs(network_output, len(images))
+        ]
+
+    def decode(self, network_output, width, height, offset=(0, 0)):
+        """
+        Turns raw YOLO layer outputs into NMS-filtered detections.
+
+        :param network_output: Output arrays of the YOLO layers, rows of [cx, cy, w, h, objectness, scores...].
+        :param width: Width of the image the boxes are scaled to.
+        :param height: Height of the image the boxes are scaled to.
+        :param offset: (x, y) subtracted from the scaled boxes, e.g. the letterbox padding.
+        :return: Structured array of DETECTION_DTYPE sorted by descending confidence.
+        """
+        with METRICS.stage("yolo_decode"):
+            output = np.concatenate(
+                [result.reshape(-1, result.shape[-1]) for result in network_output]
+            )
+
+            # OpenCV already scales class scores by objectness, so low objectness rows can never pass
+            output = output[output[:, 4] > self.p_min]
+
+            scores = output[:, 5:]
+            class_numbers = scores.argmax(axis=1)
+            confidences = scores[np.arange(len(scores)), class_numbers]
+
+            keep = confidences > self.p_min
+            output = output[keep]
+            class_numbers = class_numbers[keep]
+            confidences = confidences[keep]
+
+            # Boxes from normalized (center, size) to pixel (x_min, y_min, width, height)
+            boxes = output[:, 0:4] * np.array([width, height, width, height], dtype=np.float32)
+            boxes[:, 0:2] -= np.array(offset, dtype=np.float32)
+            bounding_boxes = np.empty((len(boxes), 4), dtype=np.int32)
+            bounding_boxes[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
+            bounding_boxes[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
+            bounding_boxes[:, 2:] = boxes[:, 2:]
+
+        self.results = self.nms(bounding_boxes, confidences, class_numbers)
+
+        detections = np.empty(len(self.results), dtype=DETECTION_DTYPE)
+        detections["class_number"] = class_numbers[self.results]
+        detections["confidence"] = confidences[self.results]
+        detections["bbox"] = bounding_boxes[self.results]
+        detections["center"] = bounding_boxes[self.results, 0:2] + bounding_boxes[self.results, 2:4] // 2
+
+        return detections
+
+    def nms(self, bounding_boxes, confidences, class_numbers):
+        """
+        Class-aware NMS, so dices and checkers never suppress each other.
+
+        :return: Indices of the kept boxes, highest confidence first.
+        """
+        if len(bounding_boxes) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        with METRICS.stage("nms"):
+            return self.__nms(bounding_boxes, confidences, class_numbers)
+
+    def __nms(self, bounding_boxes, confidences, class_numbers):
+        if hasattr(cv2.dnn, "NMSBoxesBatched"):
+            indices = cv2.dnn.NMSBoxesBatched(
+                bounding_boxes, confidences, class_numbers.astype(np.int32), self.p_min, self.threshold_nms
+            )
+        else:
+            # Shift every class into its own region so boxes of different classes never overlap
+            offsets = class_numbers.astype(np.int32)[:, None] * (bounding_boxes[:, :2].max() + bounding_boxes[:, 2:].max() + 1)
+            shifted_boxes = bounding_boxes.copy()
+            shifted_boxes[:, :2] += offsets
+            indices = cv2.dnn.NMSBoxes(shifted_boxes, confidences, self.p_min, self.threshold_nms)
+
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        return indices[np.argsort(-confidences[indices], kind="stable")]
+
+    def drawResult(self, image=None, detections=None, copy=True):
+        """
+        Draws detections on a copy of the image, by default the last detect() input and result.
+
+        :param copy: False draws on the image itself, for images made only to be drawn on.
+        """
+        image = self.image if image is None else image
+        return self.__draw(image.copy() if copy else image, detections)
 
     def drawBboxs(self):
-        image = np.zeros((self.height, self.width, 3), np.uint8)
-        if len(self.results) > 0:
-            for i in range(len(self.bounding_boxes)):
-
-                # Getting current bounding box coordinates, its width and height
-                # x_center, y_center = centers[i]
-                # print(centers[i])
-                x_min, y_min = self.bounding_boxes[i][0], self.bounding_boxes[i][1]
-                box_width, box_height = (
-                    self.bounding_boxes[i][2],
-                    self.bounding_boxes[i][3],
-                )
-                x_center, y_center = self.centers[i]
-
-                # Preparing colour for current bounding box
-                colour_box_current = self.colors[self.class_numbers[i]].tolist()
-
-                # Drawing bounding box on the original image
-                cv2.rectangle(
-                    image,
-                    (x_min, y_min),
-                    (x_min + box_width, y_min + box_height),
-                    colour_box_current,
-                    1,
-                )
-                if self.class_numbers[i] >= 6:
-                    cv2.circle(image, (x_center, y_center), 2, (255, 255, 255), 2)
-
-                # Preparing text with label and confidence for current bounding box
-                text_box_current = "{}: {:.2f}".format(
-                    self.labels[int(self.class_numbers[i])], self.confidences[i]
-                )
-
-                # Putting text with label and confidence on the original image
-                cv2.putText(
-                    image,
-                    text_box_current,
-                    (x_min, y_min - 5),
-                    cv2.FONT_HERSHEY_DUPLEX,
-                    0.4,
-                    colour_box_current,
-                    1,
-                    cv2.LINE_AA,
-                )
+        return self.__draw(np.zeros((self.height, self.width, 3), np.uint8))
+
+    def __draw(self, image, detections=None):
+        detections = self.detections if detections is None else detections
+        for detection in detections:
+            class_number = int(detection["class_number"])
+
+            # Getting current bounding box coordinates, its width and height
+            x_min, y_min, box_width, box_height = detection["bbox"].tolist()
+            x_center, y_center = detection["center"].tolist()
+
+            # Preparing colour for current bounding box
+            colour_box_current = self.colors[class_number].tolist()
+
+            # Drawing bounding box on the original image
+            cv2.rectangle(
+                image,
+                (x_min, y_min),
+                (x_min + box_width, y_min + box_height),
+                colour_box_current,
+                1,
+            )
+            if class_number >= 6:
+                cv2.circle(image, (x_center, y_center), 2, (255, 255, 255), 2)
+
+            # Preparing text with label and confidence for current bounding box
+            text_box_current = "{}: {:.2f}".format(
+                self.labels[class_number], float(detection["confidence"])
+            )
+
+            # Putting text with label and confidence on the original image
+            cv2.putText(
+                image,
+                text_box_current,
+                (x_min, y_min - 5),
+                cv2.FONT_HERSHEY_DUPLEX,
+                0.4,
+                colour_box_current,
+                1,
+                cv2.LINE_AA,
+            )
         return image
@@ -3,6 +3,8 @@ from .BoardPosition import BoardPosition
 
 
 class Dice:
+    __slots__ = ("id", "value", "confidence", "board_position", "color", "center")
+
     def __init__(
         self,
         id=0,
@@ -2,6 +2,8 @@ from .Color import Color
 
 
 class Disk:
+    __slots__ = ("color", "confidence", "center")
+
     def __init__(
         self,
         center=(0, 0),
@@ -0,0 +1,293 @@
+import time
+import cv2
+import numpy as np
+from .BackgammonCV import BackgammonCV
+from .BoardGeometry import BoardGeometry
+from .CalibrationStore import Calibration
+from .Detector import Detector
+from .ImageInput import ImageInput
+from .PipelineMetrics import METRICS
+from ...utils.resize_and_pad_image import resize_and_pad_image, get_letterbox_params
+
+CASCADE = "cascade"
+
+
+class GameParser:
+    """
+    Parses board photos with a chosen model tier, or with a cascade of two tiers.
+
+    The cascade runs the fast tier first and only escalates to the accurate one when the
+    result does not look like a real position. When the accurate model already has
+    `max_queue_depth` forward passes pending, the fast result is accepted as is.
+
+    With a `rectified_size`, parsing runs in two stages: the board corners come from the
+    calibration or from one pass of `board_tier` over the whole photo, then the board alone
+    is warped into the template frame and checkers and dices are detected on it with the
+    tier's network at rectified_size x rectified_size.
+    """
+
+    def __init__(
+        self,
+        registry,
+        fast_tier="tiny",
+        accurate_tier="full",
+        min_dice_confidence=0.5,
+        max_queue_depth=0,
+        p_min=0.2,
+        p_board=0.3,
+        threshold_nms=0.3,
+        change_threshold=0.0,
+        cache=None,
+        rectified_size=0,
+        board_tier="tiny",
+        tile_grid=0,
+        tile_overlap=0.2,
+    ):
+        self.registry = registry
+        self.fast_tier = fast_tier
+        self.accurate_tier = accurate_tier
+        self.min_dice_confidence = min_dice_confidence
+        self.max_queue_depth = max_queue_depth
+        self.p_min = p_min
+        self.p_board = p_board
+        self.threshold_nms = threshold_nms
+        # Calibrated frames whose board moved less than this reuse the previous result (0 = off)
+        self.change_threshold = change_threshold
+        # ResultCache shared by the requests of the app, None disables caching
+        self.cache = cache
+        # Network input side for the rectified board (0 = single stage on the whole photo)
+        self.rectified_size = rectified_size
+        # Tier locating the board in the first stage when there is no calibration
+        self.board_tier = board_tier
+        # Tiles along the longest side of whole photos (0 or 1 = a single letterboxed pass)
+        self.tile_grid = tile_grid
+        self.tile_overlap = tile_overlap
+
+    def parse(self, image, tier="full", calibration=None):
+        """
+        :param image: The original image of the backgammon board (array or ImageInput), any size.
+        :param tier: Model tier name or "cascade".
+        :param calibration: Optional Calibration of the camera, skips finding the board.
+        :return: ((checker_positions, dices) or None, name of the tier that produced it)
+        """
+        if self.rectified_size and calibration is None:
+            # First stage: locate the board once, every tier of a cascade then reuses it
+            image = ImageInput.wrap(image)
+            corners = self.findCorners(image, self.board_tier)
+            if corners is None:
+                return None, self.accurate_tier if tier == CASCADE else tier
+            calibration = Calibration(None, corners, image.size)
+
+        if tier != CASCADE:
+            return self.parseWith(tier, image, calibration), tier
+
+        accurate_model = self.registry.get_tier(self.accurate_tier)
+        if self.max_queue_depth and accurate_model.depth() >= self.max_queue_depth:
+            # Accurate model is saturated, a fast answer beats a late one
+            return self.parseWith(self.fast_tier, image, calibration), self.fast_tier
+
+        game_data = self.parseWith(self.fast_tier, image, calibration)
+        if game_data is not None and self.isPlausible(*game_data):
+            return game_data, self.fast_tier
+
+        return self.parseWith(self.accurate_tier, image, calibration), self.accurate_tier
+
+    def parseIfChanged(self, image, tier, calibration):
+        """
+        Same as parse() for a calibrated camera, skipping inference when the board region did
+        not change since the last parsed frame.
+
+        :return: (game data, tier, change detection stats or None when disabled)
+        """
+        # Every parse of a calibrated camera comes through here, unchanged frames included
+        calibration.markUsed()
+
+        if not self.change_threshold:
+            return (*self.parse(image, tier, calibration), None)
+
+        template = self.registry.get_template()
+        change_detector = calibration.changeDetector((template.width, template.height), self.change_threshold)
+
+        # Corners are in original pixels, the image may have been decoded at a reduced scale
+        source = ImageInput.wrap(image)
+        corners = [(x * source.scale, y * source.scale) for x, y in calibration.corners]
+
+        cached, signature = change_detector.lookup(source.image, corners)
+        if cached is not None:
+            return (*cached, change_detector.stats(unchanged=True))
+
+        start = time.perf_counter()
+        game_data, tier = self.parse(source, tier, calibration)
+        if game_data is not None:
+            change_detector.update(signature, (game_data, tier), time.perf_counter() - start)
+
+        return game_data, tier, change_detector.stats(unchanged=False)
+
+    def parseWith(self, tier, image, calibration=None):
+        if self.rectified_size and calibration is not None:
+            return self.parseRectified(tier, image, calibration)
+
+        detections, input_size = self.detect(tier, image)
+        backgammon_cv = self.createBackgammonCV(tier)
+
+        if calibration is not None:
+            # Board geometry is already known, only checkers and dices are left to find
+            geometry = calibration.geometryFor(input_size, backgammon_cv.points_template)
+            backgammon_cv.useGeometry(geometry)
+            return backgammon_cv.assign(detections)
+
+        return backgammon_cv.parseDetections(detections, p_board=self.p_board)
+
+    def parseRectified(self, tier, image, calibration):
+        """
+        Second stage: detects checkers and dices on the board warped into the template frame.
+
+        Detections then only need scaling to template space, through a BoardGeometry shared
+        by every request.
+        """
+        source = ImageInput.wrap(image)
+        template = self.registry.get_template()
+        board = self.rectify(source, calibration.corners)
+        height, width = board.shape[:2]
+
+        model = self.registry.get_tier(tier, (self.rectified_size, self.rectified_size))
+        detector = Detector(self.p_min, self.threshold_nms, model=model)
+        detections = detector.detect(board)
+
+        backgammon_cv = BackgammonCV(detector=detector, template=template)
+        backgammon_cv.useGeometry(BoardGeometry.forRectified(template.width, template.height, width, height))
+        return backgammon_cv.assign(detections)
+
+    def rectify(self, image, corners):
+        """
+        Warps the board into the template frame, scaled so its longest side is rectified_size.
+
+        :param image: Array or ImageInput.
+        :param corners: 4 board corners in original image pixels.
+        """
+        source = ImageInput.wrap(image)
+        template = self.registry.get_template()
+
+        scale = self.rectified_size / max(template.width, template.height)
+        width, height = round(template.width * scale), round(template.height * scale)
+
+        # Corners are in original pixels, the image may have been decoded at a reduced scale
+        points = np.float32(corners) * source.scale
+        destination = np.float32([(0, 0), (width, 0), (width, height), (0, height)])
+
+        with METRICS.stage("rectify"):
+            matrix = cv2.getPerspectiveTransform(points, destination)
+            return cv2.warpPerspective(source.image, matrix, (width, height), flags=cv2.INTER_LINEAR)
+
+    def findCorners(self, image, tier="full"):
+        """
+        Detects the board corners, e.g. to calibrate a fixed camera.
+
+        :param image: The original image of the backgammon board (array or ImageInput), any size.
+        :param tier: Model tier name, "cascade" uses the accurate tier.
+        :return: 4 corners [(x, y), ...] in original image pixels, or None.
+        """
+        tier = self.accurate_tier if tier == CASCADE else tier
+        source = ImageInput.wrap(image)
+
+        detections, input_size = self.detect(tier, source)
+        points_homography = self.createBackgammonCV(tier).findBoard(detections, self.p_board)
+        if points_homography is None:
+            return None
+
+        # Back from the letterboxed frame to the original one
+        ratio, top, left = get_letterbox_params(source.shape, input_size)
+        return [((x - left) / ratio, (y - top) / ratio) for x, y in points_homography]
+
+    def detect(self, tier, image):
+        """
+        Runs the tier's detector on the image, or takes its detections from the result cache
+        when the same upload was already processed.
+
+        :param image: Array or ImageInput, only decoded on a cache miss.
+        :return: (detections in the letterboxed frame, letterbox size)
+        """
+        source = ImageInput.wrap(image)
+        model = self.registry.get_tier(tier)
+
+        tiled = self.tile_grid > 1
+        # The same upload decoded at another scale gives other detections
+        options = (f"1/{source.reduction}",) + ((self.tile_grid, self.tile_overlap) if tiled else ())
+
+        key = None
+        if self.cache is not None and source.digest is not None:
+            key = self.cache.key(source.digest, model, self.p_min, self.threshold_nms, *options)
+            with METRICS.stage("cache_lookup"):
+                cached = self.cache.get(key)
+            if cached is not None:
+                detections, source.shape = cached
+                return detections, model.input_size[0]
+
+        detector = Detector(self.p_min, self.threshold_nms, model=model)
+        if tiled:
+            detections = self.toLetterbox(
+                detector.detectTiled(source.image, self.tile_grid, self.tile_overlap), source, model.input_size[0]
+            )
+        else:
+            # Letterboxed straight into the network input, the letterboxed image itself is never built
+            detections = detector.detectInLetterbox(source.image)
+
+        if key is not None:
+            self.cache.put(key, detections, source.shape)
+
+        return detections, model.input_size[0]
+
+    def toLetterbox(self, detections, image, input_size):
+        """
+        Moves detections from pixels of the decoded image to the letterboxed frame of the
+        original one, the frame of every other detection path.
+        """
+        source = ImageInput.wrap(image)
+        ratio, top, left = get_letterbox_params(source.shape, input_size)
+        ratio /= source.scale
+
+        detections = detections.copy()
+        detections["bbox"] = np.rint(detections["bbox"] * ratio + (left, top, 0, 0))
+        detections["center"] = np.rint(detections["center"] * ratio + (left, top))
+        return detections
+
+    def inputSize(self, tier):
+        """Largest image side a request for the tier may need, e.g. to size decoding."""
+        tiers = [self.fast_tier, self.accurate_tier] if tier == CASCADE else [tier]
+        # From the tier definitions, so cached requests never load a network
+        size = max(self.registry.tiers[name][2][0] for name in tiers)
+        # Every tile gets a full network input
+        return size * self.tile_grid if self.tile_grid > 1 else size
+
+    def letterbox(self, tier, image):
+        """Resizes the image to the input size of the tier."""
+        model = self.registry.get_tier(tier)
+        return resize_and_pad_image(ImageInput.wrap(image).image, model.input_size[0])
+
+    def createBackgammonCV(self, tier):
+        return BackgammonCV(
+            detector=Detector(self.p_min, self.threshold_nms, model=self.registry.get_tier(tier)),
+            template=self.registry.get_template(),
+        )
+
+    def isPlausible(self, checker_positions, dices):
+        """
+        Checks that a parsed position could be a real one.
+
+        Each player has at most 15 checkers, no point is shared by both players (the bar
+        excepted), there are at most 2 dices and all of them are confidently detected.
+        """
+        totals = {"player_1": 0, "player_2": 0}
+        for position, checkers in checker_positions.items():
+            for checker in checkers:
+                totals[checker] += 1
+            if position != "25" and len(set(checkers)) > 1:
+                return False
+
+        if any(total > 15 for total in totals.values()):
+            return False
+
+        if len(dices) > 2:
+            return False
+
+        return all(dice["confidence"] >= self.min_dice_confidence for dice in dices)
@@ -0,0 +1,264 @@
+import threading
+import numpy as np
+from .BoardState import BoardState, BAR, OFF, CHECKERS_PER_PLAYER, PLAYER_LABELS
+from .Color import Color
+
+# Move search runs along the mover's direction: 0 is borne off, 1-24 the points, 25 the bar
+ENTRY = BAR + 1
+HOME_BOARD = 6
+
+
+class GameTracker:
+    """
+    Follows the game seen by one camera and reports what changed instead of whole positions.
+
+    Every parse result is compared with the last confirmed position. A different position is
+    only confirmed once it was seen in `stability` consecutive frames, so a checker or dice
+    the detector misses for a frame produces no event. Each confirmed change is an event with
+    the new counts of the points that changed, the new roll when the dices changed, and the
+    move leading from one position to the other when it is a legal play of the roll.
+    """
+
+    def __init__(self, stability=3):
+        self.stability = max(int(stability), 1)
+        self.confirmed = BoardState.empty()
+        self.candidate = None
+        self.candidate_frames = 0
+        self.frames = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def update(self, checker_positions, dices):
+        """
+        :param checker_positions: Parse result of a frame.
+        :param dices: Dices of the same frame.
+        :return: Event of the change confirmed by this frame, or None.
+        """
+        state = BoardState.fromGameData(checker_positions, dices)
+
+        with self.lock:
+            self.frames += 1
+            if state == self.confirmed:
+                # Flicker back to the confirmed position
+                self.candidate, self.candidate_frames = None, 0
+                return None
+
+            if state == self.candidate:
+                self.candidate_frames += 1
+            else:
+                self.candidate, self.candidate_frames = state, 1
+            if self.candidate_frames < self.stability:
+                return None
+
+            previous, self.confirmed = self.confirmed, state
+            self.candidate, self.candidate_frames = None, 0
+            self.sequence += 1
+            return self.event(previous, state)
+
+    def event(self, previous, state):
+        """
+        :return: {"sequence", "frame", "points": {point: {player: count}}, "dices"?, "move"?},
+            the first event of a session also has "initial" and lists every occupied point.
+        """
+        changed = np.flatnonzero((previous.counts != state.counts).any(axis=1)).tolist()
+        event = {
+            "sequence": self.sequence,
+            "frame": self.frames,
+            "points": {
+                point_label(row): {
+                    PLAYER_LABELS[Color.WHITE]: int(state.counts[row, Color.WHITE]),
+                    PLAYER_LABELS[Color.BLACK]: int(state.counts[row, Color.BLACK]),
+                }
+                for row in changed
+            },
+        }
+
+        if self.sequence == 1:
+            # Counts against an empty board, consumers start from scratch
+            event["initial"] = True
+            return event
+
+        previous_roll, roll = sorted(previous.dices.tolist()), sorted(state.dices.tolist())
+        if roll != previous_roll:
+            event["dices"] = roll
+
+        if changed:
+            # Checkers are usually moved with the dices still on the board, or right after
+            # picking them up
+            for dices in (previous_roll, roll):
+                move = infer_move(previous.counts, state.counts, dices)
+                if move is not None:
+                    event["move"] = move
+                    break
+
+        return event
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "events": self.sequence,
+            "pending_frames": self.candidate_frames,
+            "stability": self.stability,
+        }
+
+
+def point_label(row):
+    # Keys of checker_positions ("25" is the bar), "off" for borne off checkers
+    return "off" if row == OFF else str(row + 1)
+
+
+def along(column, reverse):
+    """Counts of one color in move order: borne off, points 1-24 (or 24-1), bar."""
+    points = column[:BAR][::-1] if reverse else column[:BAR]
+    return [int(column[OFF])] + points.tolist() + [int(column[BAR])]
+
+
+def infer_move(before, after, dices):
+    """
+    Finds the play of `dices` turning one position into the other.
+
+    Only complete plays are accepted: as many dices as the position allows must be played,
+    and the larger one when only one of two different dices can be. A change that is only a
+    partial play, e.g. a missed detection, infers no move. The direction of each player is
+    not known from the board, both are tried.
+
+    :param before: (26, 2) counts of the confirmed position.
+    :param after: (26, 2) counts of the new position.
+    :param dices: Values of the roll, doubles are played four times.
+    :return: {"player", "dices", "steps": [{"from", "to", "hit"}]} or None.
+    """
+    if len(dices) != 2:
+        return None
+    moves = tuple(sorted(dices * 2 if dices[0] == dices[1] else dices))
+
+    for color in (Color.WHITE, Color.BLACK):
+        if (before[:, color] == after[:, color]).all():
+            continue
+        for reverse in (False, True):
+            mover, target = along(before[:, color], reverse), along(after[:, color], reverse)
+            opponent, target_opponent = along(before[:, 1 - color], reverse), along(after[:, 1 - color], reverse)
+
+            playable = most_dices_playable(mover, opponent, moves, {})
+            if playable == 0:
+                continue
+
+            # With a single playable dice of two different ones, the larger one if it can be
+            allowed = moves
+            if playable == 1 and len(moves) == 2 and any(legal_moves(mover, opponent, moves[1])):
+                allowed = moves[1:]
+
+            steps = search(mover, opponent, target, target_opponent, moves, allowed, playable, [], set())
+            if steps is not None:
+                return {
+                    "player": PLAYER_LABELS[color],
+                    "dices": list(dices),
+                    "steps": [
+                        {"from": coordinate_label(source, reverse), "to": coordinate_label(to, reverse), "hit": hit}
+                        for source, to, hit, _, _ in steps
+                    ],
+                }
+    return None
+
+
+def coordinate_label(coordinate, reverse):
+    if coordinate == 0:
+        return "off"
+    if coordinate == ENTRY:
+        return str(BAR + 1)
+    return str(ENTRY - coordinate if reverse else coordinate)
+
+
+def pips(counts):
+    return sum(coordinate * count for coordinate, count in enumerate(counts))
+
+
+def legal_moves(mover, opponent, die):
+    """
+    Yields every move of one checker by `die`: (from, to, hit, mover after, opponent after),
+    in move coordinates. Lone opponent checkers that are landed on go to the bar.
+    """
+    # Checkers on the bar enter before anything else moves
+    sources = [ENTRY] if mover[ENTRY] else [c for c in range(BAR, 0, -1) if mover[c]]
+    bearing_off = sum(mover[: HOME_BOARD + 1]) == CHECKERS_PER_PLAYER
+
+    for source in sources:
+        to = source - die
+        if to <= 0:
+            # Bearing off, with a larger dice only from the highest occupied point
+            if not bearing_off or (to < 0 and any(mover[source + 1: HOME_BOARD + 1])):
+                continue
+            to = 0
+        elif opponent[to] >= 2:
+            continue
+
+        next_mover = list(mover)
+        next_mover[source] -= 1
+        next_mover[to] += 1
+
+        hit = to > 0 and opponent[to] == 1
+        next_opponent = opponent
+        if hit:
+            next_opponent = list(opponent)
+            next_opponent[to] = 0
+            next_opponent[ENTRY] += 1
+
+        yield source, to, hit, next_mover, next_opponent
+
+
+def remove_die(dices, index):
+    return dices[:index] + dices[index + 1:]
+
+
+def most_dices_playable(mover, opponent, dices, memo):
+    """Largest number of `dices` any sequence of legal moves plays from this position."""
+    if not dices:
+        return 0
+
+    key = (tuple(mover), tuple(opponent), dices)
+    if key not in memo:
+        best = 0
+        for index, die in enumerate(dices):
+            if index and die == dices[index - 1]:
+                continue
+            for _, _, _, next_mover, next_opponent in legal_moves(mover, opponent, die):
+                best = max(best, 1 + most_dices_playable(next_mover, next_opponent, remove_die(dices, index), memo))
+                if best == len(dices):
+                    break
+            if best == len(dices):
+                break
+        memo[key] = best
+    return memo[key]
+
+
+def search(mover, opponent, target, target_opponent, dices, allowed, required, steps, seen):
+    """
+    Depth first search over single dice moves of the mover for a play of exactly `required`
+    dices reaching the target position.
+
+    :param allowed: Dice values the first move may use.
+    :return: [(from, to, hit, mover after, opponent after), ...] in move coordinates, or None.
+    """
+    if len(steps) == required:
+        return steps if mover == target and opponent == target_opponent else None
+
+    # Every move lowers the pip count by its dice, less only when bearing off with a larger one
+    remaining_pips = pips(mover) - pips(target)
+    if remaining_pips <= 0 or remaining_pips > sum(dices):
+        return None
+
+    key = (tuple(mover), tuple(opponent), dices)
+    if key in seen:
+        return None
+    seen.add(key)
+
+    for index, die in enumerate(dices):
+        if (index and die == dices[index - 1]) or (not steps and die not in allowed):
+            continue
+        remaining = remove_die(dices, index)
+
+        for move in legal_moves(mover, opponent, die):
+            found = search(move[3], move[4], target, target_opponent, remaining, allowed, required, steps + [move], seen)
+            if found is not None:
+                return found
+
+    return None
@@ -0,0 +1,91 @@
+import hashlib
+import cv2
+import numpy as np
+from ...utils.read_image_size import read_image_size
+from .PipelineMetrics import METRICS
+
+# Largest reduction first, JPEGs are then decoded straight from the DCT at that scale
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+class ImageInput:
+    """
+    An image as uploaded, decoded only when something actually needs its pixels.
+
+    Results cached by `digest` can then be served without decoding the upload at all.
+    `shape` is the one of the original image, read from the JPEG/PNG header when possible.
+    With a `target_size` (the network input side), the image is decoded at the smallest
+    1/2, 1/4 or 1/8 scale whose longest side still covers it, so a phone photo never
+    exists in memory at full resolution.
+    """
+
+    def __init__(self, data=None, image=None, target_size=None):
+        self.data = data
+        self.decoded = image
+        self.decoded_reduction = None
+        self.target_size = target_size
+        self.digest = hashlib.sha256(data).hexdigest() if data is not None else None
+
+        self.shape = image.shape if image is not None else None
+        if self.shape is None and data is not None:
+            size = read_image_size(data)
+            if size is not None:
+                self.shape = (size[1], size[0], 3)
+
+    @staticmethod
+    def wrap(image):
+        """Accepts either an ImageInput or an already decoded image."""
+        return image if isinstance(image, ImageInput) else ImageInput(image=image)
+
+    @property
+    def size(self):
+        """(width, height) of the original image, decoding it only if the header was unreadable."""
+        if self.shape is None:
+            self.image
+        return self.shape[1], self.shape[0]
+
+    @property
+    def scale(self):
+        """Decoded pixels per original pixel, below 1 after a reduced decode."""
+        return self.image.shape[1] / self.shape[1]
+
+    @property
+    def image(self):
+        if self.decoded is None:
+            self.decoded = self.decode()
+        return self.decoded
+
+    @property
+    def reduction(self):
+        """Factor the upload is (or will be) decoded down by, known without decoding it."""
+        if self.decoded_reduction is not None:
+            return self.decoded_reduction
+        if self.data is None or not self.target_size or self.shape is None:
+            return 1
+        for factor, _ in REDUCED_DECODE_FLAGS:
+            if max(self.shape[:2]) // factor >= self.target_size:
+                return factor
+        return 1
+
+    def decode(self):
+        reduction = self.reduction
+        flag = dict(REDUCED_DECODE_FLAGS).get(reduction, cv2.IMREAD_COLOR)
+
+        # Read the image into OpenCV format, np.frombuffer does not copy the upload
+        with METRICS.stage("decode"):
+            image = cv2.imdecode(np.frombuffer(self.data, np.uint8), flag)
+        if image is None:
+            raise ValueError("Unable to decode the image.")
+
+        if flag == cv2.IMREAD_COLOR:
+            self.shape = image.shape
+        elif (image.shape[0] > image.shape[1]) != (self.shape[0] > self.shape[1]):
+            # Rotated by an orientation tag the header parser did not see
+            self.shape = (self.shape[1], self.shape[0], 3)
+
+        self.decoded_reduction = reduction
+        return image
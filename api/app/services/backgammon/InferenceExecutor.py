@@ -0,0 +1,112 @@
+import contextvars
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ...utils.histogram import Histogram
+from .PipelineMetrics import METRICS
+from .StackProfiler import active_profiler
+
+
+class InferenceOverloaded(Exception):
+    """Raised instead of queueing once the inference queue is full."""
+
+    def __init__(self, retry_after):
+        super().__init__("Too many requests waiting for inference, retry later.")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Bounded thread pool for the CPU-bound part of requests (decoding, detection, assignment).
+
+    At most `workers` requests run at once and at most `max_queue_depth` wait for a slot;
+    past that, submit() sheds the request with InferenceOverloaded instead of letting the
+    latency of every queued request grow. The suggested retry delay is the time the queue
+    needs to drain at the recent service time.
+
+    Request threads still wait for the result: the pool bounds the CPU work and sheds
+    overload, it does not free WSGI threads, and reading uploads and writing responses stay
+    synchronous in them.
+    """
+
+    def __init__(self, workers=4, max_queue_depth=64):
+        self.workers = workers
+        self.max_queue_depth = max_queue_depth
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self.lock = threading.Lock()
+
+        self.queued = 0
+        self.running = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.completed = 0
+        # Moving average of the time a task runs, in seconds
+        self.service_time = 0.0
+
+        self.queue_waits = Histogram([0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0])
+
+    def submit(self, fn, *args):
+        """
+        :return: Future of fn(*args).
+        :raises InferenceOverloaded: When max_queue_depth tasks are already waiting.
+        """
+        with self.lock:
+            if self.max_queue_depth and self.queued >= self.max_queue_depth:
+                self.rejected += 1
+                raise InferenceOverloaded(self.retryAfter())
+            self.queued += 1
+            self.accepted += 1
+
+        # Run in a copy of the caller's context, so stages still count towards its request
+        context = contextvars.copy_context()
+        return self.executor.submit(context.run, self.__run, fn, args, time.perf_counter())
+
+    def checkCapacity(self):
+        """:raises InferenceOverloaded: When submit() would shed a task right now."""
+        with self.lock:
+            if self.max_queue_depth and self.queued >= self.max_queue_depth:
+                self.rejected += 1
+                raise InferenceOverloaded(self.retryAfter())
+
+    def run(self, fn, *args):
+        """Runs fn(*args) in the pool and waits for its result."""
+        return self.submit(fn, *args).result()
+
+    def __run(self, fn, args, enqueued):
+        started = time.perf_counter()
+        self.queue_waits.observe(started - enqueued)
+        METRICS.record("queue_wait", started - enqueued)
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+
+        try:
+            profiler = active_profiler.get()
+            if profiler is not None:
+                return profiler.call("inference", fn, *args)
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+                self.service_time = elapsed if self.completed == 1 else 0.9 * self.service_time + 0.1 * elapsed
+
+    def retryAfter(self):
+        """Whole seconds until the current queue is expected to drain, at least 1."""
+        return max(1, math.ceil(self.queued * self.service_time / self.workers))
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "max_queue_depth": self.max_queue_depth,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "service_time_ms": round(self.service_time * 1000, 2),
+                "queue_wait_seconds": self.queue_waits.snapshot(),
+            }
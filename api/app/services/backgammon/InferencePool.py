@@ -0,0 +1,266 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+FORWARD = "forward"
+LOAD = "load"
+
+
+def run_worker(connection, shm_name, cpus, threads):
+    """
+    Main loop of an inference process: one network per (cfg, weights), one task at a time.
+
+    Blobs are read from and outputs written to the shared memory block of the worker, the
+    pipe only carries shapes.
+    """
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    cv2.setNumThreads(threads)
+
+    # Spawned processes share the front end's resource tracker, which unlinks the block
+    shm = shared_memory.SharedMemory(name=shm_name)
+    networks = {}
+
+    def load(cfg_path, weights_path):
+        if (cfg_path, weights_path) not in networks:
+            network = cv2.dnn.readNetFromDarknet(cfg_path, weights_path)
+            layer_names = network.getLayerNames()
+            layers = [layer_names[i - 1] for i in network.getUnconnectedOutLayers()]
+            networks[(cfg_path, weights_path)] = (network, layers)
+        return networks[(cfg_path, weights_path)]
+
+    try:
+        while True:
+            task = connection.recv()
+            if task is None:
+                return
+
+            kind, cfg_path, weights_path, shape, inline = task
+            try:
+                network, layers = load(cfg_path, weights_path)
+
+                if kind == LOAD:
+                    # The first pass at a given input size initializes the layers, do it now
+                    start = time.perf_counter()
+                    network.setInput(np.zeros(shape, dtype=np.float32))
+                    network.forward(layers)
+                    connection.send(("ok", time.perf_counter() - start))
+                    continue
+
+                blob = inline if inline is not None else np.ndarray(shape, np.float32, buffer=shm.buf)
+                network.setInput(blob)
+                del blob
+                outputs = network.forward(layers)
+
+                if sum(output.nbytes for output in outputs) > shm.size:
+                    connection.send(("inline", outputs))
+                    continue
+
+                offset = 0
+                shapes = []
+                for output in outputs:
+                    view = np.ndarray(output.shape, np.float32, buffer=shm.buf, offset=offset)
+                    view[...] = output
+                    del view
+                    offset += output.nbytes
+                    shapes.append(output.shape)
+                connection.send(("shm", shapes))
+            except Exception as e:
+                connection.send(("error", f"{type(e).__name__}: {e}"))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        shm.close()
+
+
+class InferenceWorker:
+    """Front end side of one inference process and its shared memory block."""
+
+    def __init__(self, context, index, cpus, threads, shm_bytes):
+        self.index = index
+        self.cpus = cpus
+        self.threads = threads
+        self.tasks = 0
+        self.restarts = 0
+
+        self.shm = shared_memory.SharedMemory(create=True, size=shm_bytes)
+        self.context = context
+        self.start()
+
+    def start(self):
+        self.connection, child_connection = self.context.Pipe()
+        self.process = self.context.Process(
+            target=run_worker,
+            args=(child_connection, self.shm.name, self.cpus, self.threads),
+            name=f"inference-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_connection.close()
+
+    def restart(self):
+        self.restarts += 1
+        self.process.kill()
+        self.process.join()
+        self.start()
+
+    def send(self, kind, cfg_path, weights_path, blob):
+        """Sends a task, the blob through shared memory when it fits."""
+        inline = None
+        if blob.nbytes <= self.shm.size:
+            np.ndarray(blob.shape, np.float32, buffer=self.shm.buf)[...] = blob
+        else:
+            inline = np.ascontiguousarray(blob, dtype=np.float32)
+        self.connection.send((kind, cfg_path, weights_path, blob.shape, inline))
+
+    def receive(self):
+        status, payload = self.connection.recv()
+
+        if status == "error":
+            raise RuntimeError(payload)
+        if status == "shm":
+            # Copied out, the block is overwritten by the next task
+            outputs = []
+            offset = 0
+            for shape in payload:
+                output = np.ndarray(shape, np.float32, buffer=self.shm.buf, offset=offset).copy()
+                offset += output.nbytes
+                outputs.append(output)
+            return tuple(outputs)
+        return payload
+
+    def forward(self, cfg_path, weights_path, blob):
+        self.tasks += 1
+        try:
+            self.send(FORWARD, cfg_path, weights_path, blob)
+            return self.receive()
+        except (EOFError, OSError):
+            # Crashed, e.g. killed for memory: this request fails, the next ones get a new process
+            self.restart()
+            raise RuntimeError(f"Inference worker {self.index} died, restarted it")
+
+    def close(self):
+        try:
+            self.connection.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.shm.close()
+        self.shm.unlink()
+
+    def stats(self):
+        return {
+            "pid": self.process.pid,
+            "alive": self.process.is_alive(),
+            "cpus": sorted(self.cpus) if self.cpus else None,
+            "threads": self.threads,
+            "tasks": self.tasks,
+            "restarts": self.restarts,
+        }
+
+
+class InferencePool:
+    """
+    Pre-started inference processes, each with its own networks, CPU set and OpenCV
+    thread budget, so forward passes scale with cores instead of contending with the
+    Flask threads of the front end.
+
+    A forward pass takes an idle worker (waiting for one when all are busy), copies the
+    blob into the worker's shared memory block and reads the YOLO outputs back from it;
+    only shapes go through the pipe. Blobs or outputs larger than the block are pickled.
+    """
+
+    def __init__(self, workers, threads=None, pin_cpus=True, shm_bytes=64 * 1024 * 1024):
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+
+        # Spawned, not forked: the front end already runs threads (warmup, schedulers)
+        context = multiprocessing.get_context("spawn")
+
+        self.workers = []
+        for index in range(workers):
+            # Contiguous slice of the available CPUs per worker, shared when there are fewer CPUs than workers
+            worker_cpus = cpus[index * len(cpus) // workers:(index + 1) * len(cpus) // workers] or [cpus[index % len(cpus)]]
+            self.workers.append(
+                InferenceWorker(
+                    context,
+                    index,
+                    set(worker_cpus) if pin_cpus else None,
+                    threads or len(worker_cpus),
+                    shm_bytes,
+                )
+            )
+
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def forward(self, cfg_path, weights_path, blob):
+        """
+        :param cfg_path: Absolute Darknet cfg path.
+        :param weights_path: Absolute Darknet weights path.
+        :param blob: NCHW float32 blob.
+        :return: Outputs of the YOLO layers, as Model.forward returns them.
+        """
+        worker = self.idle.get()
+        try:
+            return worker.forward(cfg_path, weights_path, blob)
+        finally:
+            self.idle.put(worker)
+
+    def load(self, cfg_path, weights_path, input_size):
+        """
+        Loads a network in every worker and runs its first forward pass.
+
+        :return: Longest load time of a worker, in seconds.
+        """
+        blob = np.zeros((1, 3, input_size[1], input_size[0]), dtype=np.float32)
+
+        # Take every worker, so none is missed because it was busy
+        workers = [self.idle.get() for _ in self.workers]
+        try:
+            for worker in workers:
+                worker.send(LOAD, cfg_path, weights_path, blob)
+
+            # Every reply is read before raising, or the next task would get a stale one
+            load_times, errors = [], []
+            for worker in workers:
+                try:
+                    load_times.append(worker.receive())
+                except RuntimeError as e:
+                    errors.append(e)
+                except (EOFError, OSError):
+                    worker.restart()
+                    errors.append(RuntimeError(f"Inference worker {worker.index} died, restarted it"))
+            if errors:
+                raise errors[0]
+            return max(load_times)
+        finally:
+            for worker in workers:
+                self.idle.put(worker)
+
+    def busy(self):
+        return len(self.workers) - self.idle.qsize()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        for worker in self.workers:
+            worker.close()
+
+    def stats(self):
+        return {
+            "workers": [worker.stats() for worker in self.workers],
+            "busy": self.busy(),
+        }
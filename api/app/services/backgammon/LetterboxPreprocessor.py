@@ -0,0 +1,92 @@
+import contextlib
+import threading
+import cv2
+import numpy as np
+from ...utils.resize_and_pad_image import get_letterbox_params
+from .PipelineMetrics import METRICS
+
+SCALE = np.float32(1 / 255.0)
+
+
+class LetterboxBuffers:
+    """Scratch space of one in-flight forward pass."""
+
+    def __init__(self, size, batch_size=1):
+        # Resized image before it is copied into the blob, viewed at the shape of each image
+        self.canvas = np.empty(size * size * 3, dtype=np.uint8)
+        self.blob = np.zeros((batch_size, 3, size, size), dtype=np.float32)
+
+    def reserve(self, batch_size):
+        """Grows the blob to hold at least batch_size images."""
+        if len(self.blob) < batch_size:
+            self.blob = np.zeros((batch_size,) + self.blob.shape[1:], dtype=np.float32)
+
+
+class LetterboxPreprocessor:
+    """
+    Letterboxes images straight into the float32 NCHW blob of the network.
+
+    Replaces resize_and_pad_image followed by cv2.dnn.blobFromImage with a single resize
+    into a uint8 canvas, then one scaled copy per channel into the blob, which also swaps
+    BGR to RGB and transposes to CHW. Buffers are handed out from a pool, so requests reuse
+    them instead of allocating a canvas and a blob each.
+    """
+
+    def __init__(self, size, max_idle=8):
+        self.size = size
+        self.max_idle = max_idle
+        self.idle = []
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def acquire(self, batch_size=1):
+        """Lends LetterboxBuffers, the blob must not be used once the block exits."""
+        with self.lock:
+            buffers = self.idle.pop() if self.idle else None
+        if buffers is None:
+            buffers = LetterboxBuffers(self.size, batch_size)
+        buffers.reserve(batch_size)
+
+        try:
+            yield buffers
+        finally:
+            with self.lock:
+                if len(self.idle) < self.max_idle:
+                    self.idle.append(buffers)
+
+    def preprocess(self, image, buffers, index=0):
+        """
+        :param image: BGR image of any size.
+        :param buffers: LetterboxBuffers from acquire().
+        :param index: Position of the image in a batch, buffers.blob[:n] is the whole batch.
+        :return: (blob of this image, (ratio, top, left)) so that
+            letterboxed = original * ratio + (left, top).
+        """
+        with METRICS.stage("preprocess"):
+            return self.__preprocess(image, buffers, index)
+
+    def __preprocess(self, image, buffers, index):
+        ratio, top, left = get_letterbox_params(image.shape, self.size)
+        height, width = [int(x * ratio) for x in image.shape[:2]]
+
+        if (height, width) == image.shape[:2]:
+            # Already letterboxed (or exactly the input size), nothing to resize
+            resized = image
+        else:
+            resized = buffers.canvas[: height * width * 3].reshape(height, width, 3)
+            cv2.resize(image, (width, height), dst=resized)
+
+        blob = buffers.blob[index]
+        rows, cols = slice(top, top + height), slice(left, left + width)
+
+        # Padding of the previous image may differ, clear the borders around this one
+        blob[:, :top] = 0
+        blob[:, top + height:] = 0
+        blob[:, rows, :left] = 0
+        blob[:, rows, left + width:] = 0
+
+        for channel in range(3):
+            # Channel 0 of the blob is red, the last channel of a BGR image
+            np.multiply(resized[:, :, 2 - channel], SCALE, out=blob[channel, rows, cols])
+
+        return buffers.blob[index:index + 1], (ratio, top, left)
@@ -0,0 +1,253 @@
+import os
+import threading
+import time
+import cv2
+from ...utils.get_rss_bytes import get_rss_bytes
+from .BatchScheduler import BatchScheduler
+from .LetterboxPreprocessor import LetterboxPreprocessor
+from .PipelineMetrics import METRICS
+
+# Model tiers: name -> (cfg, weights, input size), paths relative to the app root
+DEFAULT_TIERS = {
+    "full": ("data/cfg/yolov4.cfg", "data/cfg/yolov4.weights", (608, 608)),
+    "tiny": ("data/cfg/tiny_tolov4.cfg", "data/cfg/tiny_tolov4.weights", (416, 416)),
+}
+
+
+class Model:
+    """
+    A Darknet network loaded once and shared by every Detector built on top of it.
+
+    cv2.dnn networks keep their input blob as internal state, so callers must hold
+    `lock` around setInput/forward. With an InferencePool, the network is loaded in the
+    pool's worker processes instead and forward passes run there. `network_factory` builds
+    the network from (cfg, weights) in place of cv2.dnn.readNetFromDarknet, e.g. a stub.
+    """
+
+    def __init__(self, cfg_path, weights_path, input_size, labels_path, pool=None, network_factory=None):
+        self.cfg_path = cfg_path
+        self.weights_path = weights_path
+        self.input_size = tuple(input_size)
+        self.labels_path = labels_path
+        self.pool = pool
+        self.network_factory = network_factory or cv2.dnn.readNetFromDarknet
+        self.lock = threading.Lock()
+
+        # Letterboxes images into reusable input blobs of this network
+        self.preprocessor = LetterboxPreprocessor(self.input_size[0])
+
+        # Set by the ModelRegistry when micro-batching is enabled
+        self.scheduler = None
+
+        # Forward passes queued or running on this network
+        self.pending = 0
+        self.pending_lock = threading.Lock()
+
+        self.labels = []
+        self.network = None
+        self.layers = []
+
+        self.load_time = 0.0
+        self.memory_bytes = 0
+
+        self.__load()
+
+    def __load(self):
+        rss_before = get_rss_bytes()
+        start = time.perf_counter()
+
+        with open(self.labels_path) as f:
+            self.labels = [line.strip() for line in f]
+
+        if self.pool is not None:
+            # Every worker loads its own copy and runs its first pass, the front end none
+            self.pool.load(self.cfg_path, self.weights_path, self.input_size)
+        else:
+            self.network = self.network_factory(self.cfg_path, self.weights_path)
+            layer_names = self.network.getLayerNames()
+            self.layers = [
+                layer_names[i - 1] for i in self.network.getUnconnectedOutLayers()
+            ]
+
+        self.load_time = time.perf_counter() - start
+        self.memory_bytes = max(get_rss_bytes() - rss_before, 0)
+
+    def forward(self, blob):
+        """
+        Runs a forward pass, through the BatchScheduler for single images when there is one.
+
+        :param blob: NCHW input blob.
+        :return: Outputs of the YOLO layers.
+        """
+        with self.pending_lock:
+            self.pending += 1
+        try:
+            # Includes waiting for a batch or a pool worker, as the request sees it
+            with METRICS.stage("forward"):
+                if self.scheduler is not None and blob.shape[0] == 1:
+                    return self.scheduler.forward(blob)
+
+                return self.run(blob)
+        finally:
+            with self.pending_lock:
+                self.pending -= 1
+
+    def run(self, blob):
+        """Runs the network on a blob right away, in a pool worker when there is a pool."""
+        if self.pool is not None:
+            return self.pool.forward(self.cfg_path, self.weights_path, blob)
+
+        with self.lock:
+            self.network.setInput(blob)
+            return self.network.forward(self.layers)
+
+    def depth(self):
+        """Number of forward passes currently waiting for or running on this network."""
+        return self.pending
+
+    def stats(self):
+        return {
+            "cfg": os.path.basename(self.cfg_path),
+            "weights": os.path.basename(self.weights_path),
+            "input_size": list(self.input_size),
+            "labels": len(self.labels),
+            "load_time_ms": round(self.load_time * 1000, 2),
+            "memory_bytes": self.memory_bytes,
+            "pending": self.pending,
+            "scheduler": self.scheduler.stats() if self.scheduler is not None else None,
+        }
+
+
+class Template:
+    """The board template image and its corner points, read once per process."""
+
+    def __init__(self, path):
+        self.path = path
+        self.image = cv2.imread(path)
+        if self.image is None:
+            raise FileNotFoundError(f"Unable to read board template: {path}")
+
+        self.height, self.width = self.image.shape[:2]
+        self.points = [
+            (0, 0),
+            (self.width, 0),
+            (self.width, self.height),
+            (0, self.height),
+        ]
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded networks keyed by (cfg, weights, input size).
+
+    Created once in create_app() and shared by all requests, so the weights are parsed
+    only the first time a model is asked for. Named tiers (e.g. "full", "tiny") map to
+    those keys so requests can pick a model without knowing its files.
+    """
+
+    def __init__(
+        self,
+        root_path,
+        tiers=None,
+        default_tier="full",
+        labels="data/cfg/coco.names",
+        template="data/images/template.jpg",
+        batching=None,
+        pool=None,
+        network_factory=None,
+    ):
+        self.root_path = root_path
+        self.tiers = {
+            name: (cfg, weights, tuple(input_size))
+            for name, (cfg, weights, input_size) in (tiers or DEFAULT_TIERS).items()
+        }
+        self.default_tier = default_tier
+        self.default_key = self.tiers[default_tier]
+        self.labels = labels
+        self.template_path = template
+        # BatchScheduler keyword arguments, None disables micro-batching
+        self.batching = batching
+        # InferencePool running the forward passes, None runs them in this process
+        self.pool = pool
+        # Builds networks from (cfg, weights), None reads them with cv2.dnn.readNetFromDarknet
+        self.network_factory = network_factory
+
+        self.models = {}
+        self.template = None
+        self.lock = threading.Lock()
+
+    def full_path(self, relative_path):
+        return os.path.join(self.root_path, relative_path)
+
+    def get(self, cfg=None, weights=None, input_size=None):
+        """
+        Returns the loaded model for the given files, loading it on first use.
+
+        :param cfg: Darknet cfg path relative to the app root, defaults to the registry default.
+        :param weights: Darknet weights path relative to the app root.
+        :param input_size: (width, height) of the network input.
+        :return: Model instance.
+        """
+        default_cfg, default_weights, default_size = self.default_key
+        key = (
+            cfg or default_cfg,
+            weights or default_weights,
+            tuple(input_size or default_size),
+        )
+
+        model = self.models.get(key)
+        if model is not None:
+            return model
+
+        with self.lock:
+            # Another request may have loaded it while we were waiting
+            if key not in self.models:
+                model = Model(
+                    self.full_path(key[0]),
+                    self.full_path(key[1]),
+                    key[2],
+                    self.full_path(self.labels),
+                    pool=self.pool,
+                    network_factory=self.network_factory,
+                )
+                if self.batching is not None:
+                    model.scheduler = BatchScheduler(model, **self.batching)
+                self.models[key] = model
+            return self.models[key]
+
+    def get_tier(self, name=None, input_size=None):
+        """
+        Returns the loaded model of a named tier.
+
+        :param name: Tier name, defaults to the registry default tier.
+        :param input_size: (width, height) overriding the tier's own, e.g. for rectified boards.
+            Loads a separate network, a cv2.dnn network runs at a single input size.
+        :return: Model instance.
+        """
+        name = name or self.default_tier
+        if name not in self.tiers:
+            raise ValueError(f"Unknown model tier: {name}")
+
+        cfg, weights, tier_size = self.tiers[name]
+        return self.get(cfg, weights, input_size or tier_size)
+
+    def get_template(self):
+        if self.template is None:
+            with self.lock:
+                if self.template is None:
+                    self.template = Template(self.full_path(self.template_path))
+        return self.template
+
+    def stats(self):
+        return {
+            "models": [
+                dict(model.stats(), key="|".join(map(str, key)))
+                for key, model in self.models.items()
+            ],
+            "tiers": {
+                name: "|".join(map(str, key)) for name, key in self.tiers.items()
+            },
+            "template_loaded": self.template is not None,
+            "rss_bytes": get_rss_bytes(),
+            "inference_pool": self.pool.stats() if self.pool is not None else None,
+        }
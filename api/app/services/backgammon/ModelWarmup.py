@@ -0,0 +1,87 @@
+import threading
+import time
+from .CalibrationStore import Calibration
+from .GameParser import GameParser
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class ModelWarmup:
+    """
+    Loads model tiers at startup and runs one inference per tier on the board template.
+
+    The first forward pass of an OpenCV DNN network initializes its layers and is much
+    slower than the following ones, so a worker only reports ready once every tier has
+    been through it.
+    """
+
+    def __init__(self, registry, tiers, rectified_size=0):
+        self.registry = registry
+        self.tiers = list(tiers)
+        # Two-stage parsing runs each tier a second time, at this input size
+        self.rectified_size = rectified_size
+        self.status = PENDING if self.tiers else READY
+        self.error = None
+        self.timings = {}
+        self.started_at = None
+        self.finished_at = None
+        self.thread = None
+
+    def start(self, background=True):
+        if not self.tiers:
+            return
+        if background:
+            self.thread = threading.Thread(target=self.run, name="model-warmup", daemon=True)
+            self.thread.start()
+        else:
+            self.run()
+
+    def run(self):
+        self.status = LOADING
+        self.started_at = time.time()
+        parser = GameParser(self.registry, rectified_size=self.rectified_size)
+
+        try:
+            template = self.registry.get_template()
+
+            for tier in self.tiers:
+                start = time.perf_counter()
+                model = self.registry.get_tier(tier)
+                loaded = time.perf_counter()
+
+                # Synthetic frame: the template letterboxed to the tier's input size
+                parser.parseWith(tier, template.image)
+                if self.rectified_size:
+                    # The template is its own rectified board
+                    calibration = Calibration(None, template.points, (template.width, template.height))
+                    parser.parseWith(tier, template.image, calibration)
+                warmed = time.perf_counter()
+
+                self.timings[tier] = {
+                    "load_ms": round((loaded - start) * 1000, 2),
+                    "weights_load_ms": round(model.load_time * 1000, 2),
+                    "warmup_ms": round((warmed - loaded) * 1000, 2),
+                }
+
+            self.status = READY
+        except Exception as e:
+            self.error = str(e)
+            self.status = FAILED
+        finally:
+            self.finished_at = time.time()
+
+    def isReady(self):
+        return self.status == READY
+
+    def toDict(self):
+        return {
+            "status": self.status,
+            "tiers": self.tiers,
+            "timings": self.timings,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
@@ -0,0 +1,145 @@
+import contextlib
+import contextvars
+import threading
+import time
+from ...utils.histogram import Histogram
+
+# Seconds, from a cached lookup to a full forward pass on a slow CPU
+STAGE_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# RequestTimings of the request being handled, copied into the threads that run its inference
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Time spent per stage by one request, rendered as a Server-Timing header."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}  # stage -> seconds, in the order stages first ran
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def header(self):
+        with self.lock:
+            stages = list(self.stages.items())
+        stages.append(("total", time.perf_counter() - self.start))
+        return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in stages)
+
+
+class PipelineMetrics:
+    """
+    Histograms and counters of the parse/detect pipeline, rendered in the Prometheus text format.
+
+    Every stage (decode, preprocess, forward, NMS, assignment, encoding...) is timed with
+    `with METRICS.stage("name"):` wherever it runs, request thread, inference executor or stream
+    session alike. When the current context has RequestTimings bound, the stage also counts
+    towards that request's Server-Timing header.
+    """
+
+    def __init__(self, prefix="backgammon", buckets=STAGE_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.enabled = True
+
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.counters = {}  # (name, labels) -> value
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Times the block as one run of the stage."""
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        """Records a stage duration measured elsewhere, e.g. a queue wait."""
+        if not self.enabled:
+            return
+
+        self.observe("stage_duration_seconds", seconds, stage=name)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.add(name, seconds)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram(self.buckets))
+        histogram.observe(value)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def track(self):
+        """
+        Binds new RequestTimings to the current context.
+
+        :return: (timings, token for request_timings.reset)
+        """
+        timings = RequestTimings()
+        return timings, request_timings.set(timings)
+
+    def render(self, samples=()):
+        """
+        :param samples: Extra (kind, name, labels, value) samples of other components, e.g. the
+            queue depth as a "gauge" or the cache hits as a "counter".
+        :return: Every metric in the Prometheus text exposition format.
+        """
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+        for (name, labels), histogram in histograms:
+            declare(name, "histogram")
+            snapshot = histogram.snapshot()
+            for bound, count in snapshot["buckets"]:
+                lines.append(f"{self.prefix}_{name}_bucket{self.labels(labels + (('le', bound),))} {count}")
+            lines.append(f"{self.prefix}_{name}_sum{self.labels(labels)} {snapshot['sum']}")
+            lines.append(f"{self.prefix}_{name}_count{self.labels(labels)} {snapshot['count']}")
+
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append(f"{self.prefix}_{name}{self.labels(labels)} {value}")
+
+        for kind, name, labels, value in samples:
+            declare(name, kind)
+            lines.append(f"{self.prefix}_{name}{self.labels(tuple(sorted(labels.items())))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def labels(labels):
+        if not labels:
+            return ""
+        escaped = (
+            (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for key, value in labels
+        )
+        return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+# Shared by every component of the process, so stages deep in the services need no plumbing
+METRICS = PipelineMetrics()
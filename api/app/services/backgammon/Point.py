@@ -3,22 +3,34 @@ from .Color import Color
 
 
 class Point:
+    __slots__ = ("id", "center", "bbox", "bbox_warped", "color", "board")
+
     def __init__(self, id=0, center=(0, 0), bbox=[]):
         self.id = id
         self.center = center
         self.bbox = bbox
         self.bbox_warped = bbox
-        self.disks = []
         self.color = Color.WHITE if (id % 2 == 0) else Color.BLACK
+        # Set by Board.addPoint, the disks of the point live in the board's state
+        self.board = None
+
+    @property
+    def disks(self):
+        return self.board.disksOn(self.id) if self.board is not None else []
 
     def addDisk(self, disk):
-        self.disks.append(disk)
+        if self.board is None:
+            raise ValueError("Point is not on a board")
+        self.board.addDisk(disk, self.id)
 
     def reset(self):
-        self.bbox_warped = self.bbox.copy()
+        # Bboxes are never modified in place, share them
+        self.bbox_warped = self.bbox
 
     def clear(self):
-        self.disks.clear()
+        # Only the point loses its disks, Board.disks keeps every detection
+        if self.board is not None:
+            self.board.state = self.board.state.withPointCleared(self.id)
 
     def __str__(self):
         res = ""
@@ -29,10 +41,9 @@ class Point:
         return res
 
     def copy(self):
-        point = Point(self.id, self.center, self.bbox.copy())
-        for disk in self.disks:
-            newDisk = disk.copy()
-            point.addDisk(newDisk)
+        # Disks come with the state of the board the copy is added to
+        point = Point(self.id, self.center, self.bbox)
+        point.bbox_warped = self.bbox_warped
         point.color = self.color
 
         return point
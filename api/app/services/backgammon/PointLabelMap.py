@@ -0,0 +1,56 @@
+import functools
+import cv2
+import numpy as np
+from .Constants import POINT_BBOXS
+
+
+class PointLabelMap:
+    """
+    Raster of the template where each pixel holds the id of the point it belongs to.
+
+    Built once per template size from POINT_BBOXS: pixel value i + 1 for POINT_BBOXS[i]
+    (25 being the bar) and 0 outside every point, so looking up any number of template
+    space coordinates is a single fancy-indexing operation.
+    """
+
+    def __init__(self, width, height, point_bboxs=POINT_BBOXS):
+        self.width = width
+        self.height = height
+        self.labels = np.zeros((height, width), dtype=np.uint8)
+
+        for i, bbox in enumerate(point_bboxs):
+            cv2.fillPoly(self.labels, [np.asarray(bbox, dtype=np.int32)], i + 1)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def forTemplate(width, height):
+        return PointLabelMap(width, height)
+
+    def contains(self, points):
+        """
+        :param points: Array of shape (N, 2) with template space (x, y) coordinates.
+        :return: Boolean array, True for the points that fall inside the template.
+        """
+        points = np.asarray(points)
+        return (
+            (points[:, 0] >= 0)
+            & (points[:, 0] < self.width)
+            & (points[:, 1] >= 0)
+            & (points[:, 1] < self.height)
+        )
+
+    def lookup(self, points):
+        """
+        :param points: Array of shape (N, 2) with template space (x, y) coordinates.
+        :return: Array of N point ids, 0 for coordinates outside every point.
+        """
+        points = np.asarray(points)
+        ids = np.zeros(len(points), dtype=np.int32)
+
+        inside = self.contains(points)
+        # fillPoly paints the pixels whose centers are inside a polygon, so round to the nearest one
+        pixels = np.rint(points[inside]).astype(np.int32)
+        np.minimum(pixels, [self.width - 1, self.height - 1], out=pixels)
+        ids[inside] = self.labels[pixels[:, 1], pixels[:, 0]]
+
+        return ids
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+# Rough size of a key and its bookkeeping, so empty results still count against max_bytes
+ENTRY_OVERHEAD = 256
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of raw detections keyed by image content and model parameters.
+
+    Entries expire after `ttl` seconds and the least recently used ones are evicted once
+    the cached arrays exceed `max_bytes`. With `directory` set, entries are also written
+    to disk so they survive worker restarts.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=3600, directory=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = directory or None
+
+        self.entries = OrderedDict()  # key -> (detections, shape, stored_at)
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(digest, model, p_min, threshold_nms, *options):
+        # Options are anything else the detections depend on, e.g. the tile grid
+        return "|".join(
+            map(str, (digest, model.cfg_path, model.weights_path, model.input_size, p_min, threshold_nms) + options)
+        )
+
+    def get(self, key):
+        """
+        :return: (detections, original image shape) or None.
+        """
+        now = time.time()
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if now - entry[2] <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0], entry[1]
+                self.__remove(key)
+
+        entry = self.__read(key, now)
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self.__insert(key, entry)
+        return entry[0], entry[1]
+
+    def put(self, key, detections, shape):
+        entry = (detections, tuple(shape), time.time())
+        with self.lock:
+            self.__insert(key, entry)
+        self.__write(key, entry)
+
+    def __insert(self, key, entry):
+        if key in self.entries:
+            self.__remove(key)
+
+        self.entries[key] = entry
+        self.bytes += entry[0].nbytes + ENTRY_OVERHEAD
+
+        while self.bytes > self.max_bytes and self.entries:
+            self.__remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def __remove(self, key):
+        detections, _, _ = self.entries.pop(key)
+        self.bytes -= detections.nbytes + ENTRY_OVERHEAD
+
+    # Disk tier ----------------------------------------------------------------------
+
+    def __path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".npz")
+
+    def __read(self, key, now):
+        if not self.directory:
+            return None
+
+        path = self.__path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if now - stored_at > self.ttl:
+                os.remove(path)
+                return None
+            with np.load(path) as data:
+                return data["detections"], tuple(data["shape"].tolist()), stored_at
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def __write(self, key, entry):
+        if not self.directory:
+            return
+
+        path = self.__path(key)
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary_path, "wb") as f:
+                np.savez(f, detections=entry[0], shape=np.asarray(entry[1]))
+            os.replace(temporary_path, path)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "disk": self.directory is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
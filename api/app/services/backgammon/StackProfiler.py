@@ -0,0 +1,120 @@
+import contextlib
+import contextvars
+import os
+import sys
+import threading
+import time
+import types
+import cv2
+
+# StackProfiler of the request being handled, copied into the threads that run its inference
+active_profiler = contextvars.ContextVar("active_profiler", default=None)
+
+# OpenCV functions carry no module, name them after where they are exposed
+CV2_FUNCTION_NAMES = {
+    id(function): f"{module.__name__}.{name}"
+    for module in (cv2, cv2.dnn)
+    for name, function in vars(module).items()
+    if isinstance(function, types.BuiltinFunctionType)
+}
+
+
+class ProfileSession:
+    """Call stack of one thread while it is profiled, with the self time of every stack seen."""
+
+    def __init__(self, label):
+        self.root = [label]
+        self.names = []
+        self.frames = []  # [start, time spent in children] per entry of names
+        self.totals = {}  # "a;b;c" -> seconds spent in c itself
+
+    def callback(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == "call":
+            self.push(frame_name(frame), now)
+        elif event == "c_call":
+            self.push(c_function_name(arg), now)
+        elif event in ("return", "c_return", "c_exception"):
+            # Returns from frames entered before profiling started have nothing to pop
+            if self.names:
+                self.pop(now)
+
+    def push(self, name, now):
+        self.names.append(name)
+        self.frames.append([now, 0.0])
+
+    def pop(self, now):
+        start, children = self.frames.pop()
+        elapsed = now - start
+        stack = ";".join(self.root + self.names)
+        self.totals[stack] = self.totals.get(stack, 0.0) + elapsed - children
+        self.names.pop()
+        if self.frames:
+            self.frames[-1][1] += elapsed
+
+    def finish(self):
+        now = time.perf_counter()
+        while self.names:
+            self.pop(now)
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def c_function_name(function):
+    # cv2.resize, numpy.concatenate, ndarray.copy...
+    if id(function) in CV2_FUNCTION_NAMES:
+        return CV2_FUNCTION_NAMES[id(function)]
+
+    module = getattr(function, "__module__", None)
+    owner = getattr(function, "__self__", None)
+    if module is None and isinstance(owner, types.ModuleType):
+        module = owner.__name__
+    name = getattr(function, "__qualname__", None) or getattr(function, "__name__", None) or type(function).__name__
+    name = f"{module}.{name}" if module else name
+    # Separators of the collapsed format
+    return name.replace(";", ":").replace(" ", "_")
+
+
+class StackProfiler:
+    """
+    Deterministic profiler of a single request, output in the collapsed stack format of
+    flame graph tools (`frame;frame;frame microseconds` per line).
+
+    Every Python function and every C call (OpenCV, numpy) is timed through sys.setprofile
+    while running() is active in a thread; the threads of one request each get their own root
+    frame, e.g. "request" and "inference". Nothing is hooked unless a request asks for it.
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def running(self, label):
+        """Profiles the current thread for the duration of the block."""
+        session = ProfileSession(label)
+        previous = sys.getprofile()
+        sys.setprofile(session.callback)
+        try:
+            yield self
+        finally:
+            sys.setprofile(previous)
+            session.finish()
+            with self.lock:
+                for stack, seconds in session.totals.items():
+                    self.totals[stack] = self.totals.get(stack, 0.0) + seconds
+
+    def call(self, label, fn, *args):
+        with self.running(label):
+            return fn(*args)
+
+    def collapsed(self):
+        """:return: One `stack microseconds` line per stack, heaviest first."""
+        with self.lock:
+            totals = sorted(self.totals.items(), key=lambda item: -item[1])
+        return "".join(
+            f"{stack} {round(seconds * 1e6)}\n" for stack, seconds in totals if seconds >= 5e-7
+        )
@@ -0,0 +1,103 @@
+import threading
+import time
+from .CalibrationStore import Calibration
+from .ImageInput import ImageInput
+
+
+class StreamSession:
+    """
+    Parses the frames of one live camera connection.
+
+    Frames are fed in as they arrive and only the most recent unprocessed one is kept, so
+    when inference falls behind, stale frames are dropped instead of queued. The board is
+    located once (or taken from a calibration) and its geometry reused for every frame.
+    """
+
+    def __init__(self, parser, tier="full", calibration=None, tracker=None):
+        self.parser = parser
+        self.tier = tier
+        self.calibration = calibration
+        # GameTracker turning results into change events, whole positions are sent without one
+        self.tracker = tracker
+
+        self.pending = None
+        self.closed = False
+        self.condition = threading.Condition()
+
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+    def feed(self, frame_bytes):
+        """Queues an encoded frame, replacing the previous one if it was not processed yet."""
+        with self.condition:
+            if self.pending is not None:
+                self.dropped += 1
+            self.received += 1
+            self.pending = (self.received, frame_bytes, time.perf_counter())
+            self.condition.notify()
+
+    def close(self):
+        """No more frames will be fed, frames() ends once the last one is processed."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def frames(self):
+        """Yields (frame number, encoded frame, arrival time) for the latest frame, until closed."""
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                frame, self.pending = self.pending, None
+            yield frame
+
+    def process(self, index, frame_bytes, received_at):
+        """
+        Decodes and parses one frame.
+
+        :return: Dictionary sent back to the client for this frame.
+        """
+        result = {"frame": index}
+
+        # Decoded at the smallest scale the tier needs, on first use
+        image = ImageInput(frame_bytes, target_size=self.parser.inputSize(self.tier))
+        try:
+            image.image
+        except ValueError:
+            result["error"] = "Unable to decode the frame."
+            return self.finish(result, received_at)
+
+        if self.calibration is None:
+            # Locate the board once, later frames reuse its geometry
+            corners = self.parser.findCorners(image, self.tier)
+            if corners is None:
+                result["error"] = "Unable to detect the game board."
+                return self.finish(result, received_at)
+            self.calibration = Calibration(None, corners, image.size)
+
+        if self.calibration.image_size != image.size:
+            result["error"] = "Frame size differs from the calibration."
+            return self.finish(result, received_at)
+
+        game_data, tier, changes = self.parser.parseIfChanged(image, self.tier, self.calibration)
+        result["model"] = tier
+        if game_data is None:
+            result["error"] = "Unable to detect the game board."
+        elif self.tracker is not None:
+            result["event"] = self.tracker.update(*game_data)
+            result["sequence"] = self.tracker.sequence
+        else:
+            result["checker_positions"], result["dices"] = game_data
+        if changes is not None:
+            result["change_detection"] = changes
+
+        return self.finish(result, received_at)
+
+    def finish(self, result, received_at):
+        self.processed += 1
+        result["latency_ms"] = round((time.perf_counter() - received_at) * 1000, 2)
+        result["dropped"] = self.dropped
+        return result
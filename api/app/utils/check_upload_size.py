@@ -0,0 +1,28 @@
+from flask import current_app, request
+from werkzeug.exceptions import LengthRequired, RequestEntityTooLarge
+
+# Endpoints with their own limit (config key), None for bodies bounded by the view itself
+UPLOAD_LIMITS = {
+    "backgammon.parse_batch": "BATCH_MAX_UPLOAD_BYTES",
+    "backgammon.stream": None,
+}
+
+
+def check_upload_size():
+    """
+    Refuses bodies over the limit of their endpoint (MAX_UPLOAD_BYTES by default) with a 413,
+    from the Content-Length header before anything is read or any form is parsed.
+
+    Multipart bodies without a Content-Length could only be bounded once spooled to disk and
+    are refused with a 411; raw bodies without one are bounded by read_upload as they are read.
+    """
+    key = UPLOAD_LIMITS.get(request.endpoint, "MAX_UPLOAD_BYTES")
+    if key is None:
+        return None
+
+    if request.content_length is None:
+        if request.mimetype == "multipart/form-data":
+            raise LengthRequired()
+    elif request.content_length > current_app.config[key]:
+        raise RequestEntityTooLarge()
+    return None
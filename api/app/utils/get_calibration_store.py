@@ -0,0 +1,5 @@
+from flask import current_app
+
+def get_calibration_store():
+    """Returns the CalibrationStore created for the current app in create_app()."""
+    return current_app.extensions['calibration_store']
@@ -1,8 +1,11 @@
 import os
-from flask import current_app
+from flask import current_app, has_app_context
+
+# The app package, root of the data directory when no Flask app is running (scripts, workers)
+DEFAULT_ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 def get_full_path(relative_path):
     """Converts a relative path to a full path using the stored root path."""
-    root_path = current_app.config['ROOT_PATH']
+    root_path = current_app.config['ROOT_PATH'] if has_app_context() else DEFAULT_ROOT_PATH
     full_path = os.path.join(root_path, relative_path)
-    return full_path
\ No newline at end of file
+    return full_path
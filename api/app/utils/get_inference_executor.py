@@ -0,0 +1,5 @@
+from flask import current_app
+
+def get_inference_executor():
+    """Returns the InferenceExecutor of the current app."""
+    return current_app.extensions['inference_executor']
@@ -0,0 +1,5 @@
+from flask import current_app
+
+def get_model_registry():
+    """Returns the ModelRegistry created for the current app in create_app()."""
+    return current_app.extensions['model_registry']
@@ -0,0 +1,5 @@
+from flask import current_app
+
+def get_model_warmup():
+    """Returns the ModelWarmup started for the current app in create_app()."""
+    return current_app.extensions['model_warmup']
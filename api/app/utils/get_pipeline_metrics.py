@@ -0,0 +1,5 @@
+from flask import current_app
+
+def get_pipeline_metrics():
+    """Returns the PipelineMetrics of the current app."""
+    return current_app.extensions['pipeline_metrics']
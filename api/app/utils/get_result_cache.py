@@ -0,0 +1,5 @@
+from flask import current_app
+
+def get_result_cache():
+    """Returns the ResultCache of the current app, None when caching is disabled."""
+    return current_app.extensions['result_cache']
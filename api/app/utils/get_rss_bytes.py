@@ -0,0 +1,14 @@
+import os
+import sys
+import resource
+
+
+def get_rss_bytes():
+    """Returns the resident set size of the current process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # No procfs, fall back to the peak RSS (bytes on macOS, KiB elsewhere)
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
@@ -0,0 +1,30 @@
+import math
+import numpy as np
+
+
+def get_tile_windows(image_shape, grid=2, overlap=0.2):
+    """
+    Splits an image into overlapping square tiles.
+
+    :param image_shape: (height, width, ...) of the image.
+    :param grid: Number of tiles along the longest side.
+    :param overlap: Fraction of a tile's side shared with the neighbouring tile.
+    :return: List of (x, y, width, height) windows covering the whole image.
+    """
+    height, width = image_shape[:2]
+
+    # Side such that `grid` tiles overlapping by `overlap` span the longest side
+    side = math.ceil(max(height, width) / (grid - (grid - 1) * overlap))
+    step = side * (1 - overlap)
+
+    def starts(length):
+        if length <= side:
+            return [0]
+        count = math.ceil((length - side) / step) + 1
+        return np.linspace(0, length - side, count).round().astype(int).tolist()
+
+    return [
+        (x, y, min(side, width), min(side, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
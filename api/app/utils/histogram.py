@@ -0,0 +1,39 @@
+import bisect
+import threading
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram, buckets are inclusive upper bounds."""
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        """Returns cumulative counts per bucket, like a Prometheus histogram."""
+        with self.lock:
+            counts = list(self.counts)
+            total, value_sum = self.count, self.sum
+
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets + ["+Inf"], counts):
+            running += count
+            cumulative.append([bound, running])
+
+        return {
+            "buckets": cumulative,
+            "count": total,
+            "sum": value_sum,
+            "mean": value_sum / total if total else 0.0,
+        }
@@ -0,0 +1,107 @@
+JPEG_START = b"\xff\xd8"
+JPEG_END = 0xD9
+START_OF_SCAN = 0xDA
+
+# Markers without a length field: TEM, RST0-7 and SOI
+STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD9)}
+
+
+def find_jpeg_end(buffer, position, in_scan):
+    """
+    Walks the marker segments of the JPEG starting at buffer[0] until its end of image marker.
+
+    Segments are skipped by their length field, so an EXIF thumbnail (a whole JPEG inside
+    APP1) does not end the frame. Only entropy coded data after a start of scan is searched
+    for markers, skipping stuffed FF 00 bytes and restart markers; progressive JPEGs go back
+    to segments between scans.
+
+    :param position: Where the previous call stopped, 2 (after SOI) on the first call.
+    :param in_scan: Whether the previous call stopped inside entropy coded data.
+    :return: (index just past the end of image marker or -1 when more bytes are needed,
+        position and in_scan to resume from once they arrived)
+    """
+    length = len(buffer)
+
+    while True:
+        if in_scan:
+            index = buffer.find(b"\xff", position)
+            if index < 0:
+                return -1, max(position, length), True
+            if index + 1 >= length:
+                return -1, index, True
+
+            code = buffer[index + 1]
+            if code == 0xFF:
+                # Fill byte, the marker code follows
+                position = index + 1
+            elif code == 0x00 or 0xD0 <= code <= 0xD7:
+                position = index + 2
+            else:
+                position, in_scan = index, False
+            continue
+
+        if position + 1 >= length:
+            return -1, position, False
+        if buffer[position] != 0xFF:
+            # Not a marker where one should be, fall back to searching for the end marker
+            in_scan = True
+            continue
+
+        code = buffer[position + 1]
+        if code == 0xFF:
+            position += 1
+        elif code == JPEG_END:
+            return position + 2, position, False
+        elif code in STANDALONE_MARKERS:
+            position += 2
+        else:
+            if position + 3 >= length:
+                return -1, position, False
+            position += 2 + int.from_bytes(buffer[position + 2:position + 4], "big")
+            in_scan = code == START_OF_SCAN
+
+
+def iter_jpeg_frames(stream, chunk_size=64 * 1024, max_frame_size=16 * 1024 * 1024):
+    """
+    Yields complete JPEG images from a byte stream as they arrive.
+
+    Works for MJPEG (multipart/x-mixed-replace) bodies and for plain concatenated JPEGs:
+    anything between the end of an image and the next start of image marker, such as
+    multipart boundaries and headers, is skipped.
+
+    :param stream: File-like object with a read(size) method.
+    :param chunk_size: Bytes read per call.
+    :param max_frame_size: Frames growing past this are dropped to bound memory.
+    """
+    buffer = bytearray()
+    in_frame = False
+    position, in_scan = 2, False
+
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+
+        while True:
+            if not in_frame:
+                start = buffer.find(JPEG_START)
+                if start < 0:
+                    # Keep a possible half marker at the end
+                    del buffer[:-1]
+                    break
+                # The frame starts at buffer[0] from now on
+                del buffer[:start]
+                in_frame = True
+                position, in_scan = 2, False
+
+            end, position, in_scan = find_jpeg_end(buffer, position, in_scan)
+            if end < 0:
+                if len(buffer) > max_frame_size:
+                    del buffer[:]
+                    in_frame = False
+                break
+
+            yield bytes(buffer[:end])
+            del buffer[:end]
+            in_frame = False
@@ -0,0 +1,46 @@
+import functools
+import os
+import time
+import uuid
+from flask import current_app, request, make_response, Response
+from ..services.backgammon.StackProfiler import StackProfiler, active_profiler
+
+
+def profiled(view):
+    """
+    Profiles a view when PROFILING_ENABLED is set and the request asks for it, with an
+    `X-Profile` header or a `profile` query parameter.
+
+    "1" stores the collapsed stacks in PROFILE_DIR and names the file in the X-Profile-File
+    response header, "collapsed" returns them in place of the normal response.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config['PROFILING_ENABLED']:
+            return view(*args, **kwargs)
+
+        mode = request.headers.get('X-Profile') or request.args.get('profile')
+        if mode not in ("1", "collapsed"):
+            return view(*args, **kwargs)
+
+        profiler = StackProfiler()
+        token = active_profiler.set(profiler)
+        try:
+            with profiler.running("request"):
+                response = make_response(view(*args, **kwargs))
+        finally:
+            active_profiler.reset(token)
+
+        if mode == "collapsed":
+            return Response(profiler.collapsed(), mimetype="text/plain")
+
+        directory = current_app.config['PROFILE_DIR']
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{uuid.uuid4().hex[:8]}.folded"
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(profiler.collapsed())
+
+        response.headers['X-Profile-File'] = name
+        return response
+
+    return wrapper
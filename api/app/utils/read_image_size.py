@@ -0,0 +1,84 @@
+import struct
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# JPEG start of frame markers (all but DHT, JPG and DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_exif_orientation(segment):
+    """
+    Returns the EXIF orientation tag of an APP1 segment payload, 1 when absent.
+    """
+    if segment[:6] != b"Exif\x00\x00":
+        return 1
+
+    tiff = segment[6:]
+    if tiff[:2] == b"II":
+        endian = "<"
+    elif tiff[:2] == b"MM":
+        endian = ">"
+    else:
+        return 1
+
+    try:
+        (ifd_offset,) = struct.unpack_from(endian + "I", tiff, 4)
+        (entries,) = struct.unpack_from(endian + "H", tiff, ifd_offset)
+        for i in range(entries):
+            tag, _, _, value = struct.unpack_from(endian + "HHIH", tiff, ifd_offset + 2 + i * 12)
+            if tag == 0x0112:
+                return value
+    except struct.error:
+        pass
+
+    return 1
+
+
+def read_image_size(data):
+    """
+    Reads the dimensions of a JPEG or PNG from its header, without decoding it.
+
+    JPEG dimensions account for the EXIF orientation, since cv2.imdecode applies it.
+
+    :param data: Encoded image bytes (bytes, bytearray or memoryview).
+    :return: (width, height) or None if the format is not recognised.
+    """
+    data = memoryview(data)
+
+    if bytes(data[:8]) == PNG_SIGNATURE and len(data) >= 24:
+        width, height = struct.unpack(">II", data[16:24])
+        return width, height
+
+    if bytes(data[:2]) != b"\xff\xd8":
+        return None
+
+    orientation = 1
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+
+        # Fill bytes and markers without a length
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            offset += 2
+            continue
+
+        (length,) = struct.unpack(">H", data[offset + 2:offset + 4])
+
+        if marker == 0xE1 and orientation == 1:
+            orientation = read_exif_orientation(bytes(data[offset + 4:offset + 2 + length]))
+
+        if marker in JPEG_SOF_MARKERS:
+            if offset + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            # Orientations 5 to 8 rotate the image by 90 degrees
+            return (height, width) if orientation >= 5 else (width, height)
+
+        offset += 2 + length
+
+    return None
@@ -0,0 +1,51 @@
+from flask import current_app, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Bodies that are the encoded image itself rather than a multipart form
+RAW_UPLOAD_MIMETYPES = ("application/octet-stream", "image/jpeg", "image/png")
+
+
+def read_upload():
+    """
+    Reads the uploaded image of the current request.
+
+    Either the `image` part of a multipart form, or the raw body for application/octet-stream
+    (and image/jpeg, image/png) requests, which skips the multipart parser and the temporary
+    file it spools large parts to. Bodies over MAX_UPLOAD_BYTES are refused with a 413, before
+    they are read when they have a Content-Length (see check_upload_size).
+
+    :return: (encoded image bytes, None) or (None, error response).
+    """
+    if request.mimetype in RAW_UPLOAD_MIMETYPES:
+        data = read_body(current_app.config['MAX_UPLOAD_BYTES'])
+        if not data:
+            return None, (jsonify({"error": "Empty request body"}), 400)
+        return data, None
+
+    if 'image' not in request.files:
+        return None, (jsonify({"error": "No image part in the request"}), 400)
+
+    image_file = request.files['image']
+
+    if image_file.filename == '':
+        return None, (jsonify({"error": "No selected file"}), 400)
+
+    return image_file.read(), None
+
+
+def read_body(limit, chunk_size=64 * 1024):
+    """Raw request body, a 413 once more than `limit` bytes arrived without a Content-Length."""
+    if request.content_length is not None:
+        # Already checked against the limit before the view ran
+        return request.get_data(cache=False)
+
+    chunks = []
+    size = 0
+    while True:
+        chunk = request.stream.read(chunk_size)
+        if not chunk:
+            return b"".join(chunks)
+        size += len(chunk)
+        if size > limit:
+            raise RequestEntityTooLarge()
+        chunks.append(chunk)
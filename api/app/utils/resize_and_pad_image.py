@@ -2,11 +2,29 @@ import cv2
 import numpy as np
 
 
+def get_letterbox_params(image_shape, desired_size=1024):
+    """
+    Returns how resize_and_pad_image maps an image of the given shape.
+
+    :param image_shape: (height, width, ...) of the original image.
+    :return: (ratio, top, left) so that letterboxed = original * ratio + (left, top).
+    """
+    old_size = image_shape[:2]  # Get the current size (height, width)
+
+    # Calculate the ratio of the desired size to the old size
+    ratio = float(desired_size) / max(old_size)
+    new_size = tuple([int(x * ratio) for x in old_size])
+
+    top = (desired_size - new_size[0]) // 2
+    left = (desired_size - new_size[1]) // 2
+    return ratio, top, left
+
+
 def resize_and_pad_image(image, desired_size=1024):
     old_size = image.shape[:2]  # Get the current size (height, width)
 
     # Calculate the ratio of the desired size to the old size
-    ratio = float(desired_size) / max(old_size)
+    ratio, top, left = get_letterbox_params(old_size, desired_size)
     new_size = tuple([int(x * ratio) for x in old_size])
 
     # Resize the image while keeping the aspect ratio
@@ -16,11 +34,6 @@ def resize_and_pad_image(image, desired_size=1024):
     new_image = np.zeros((desired_size, desired_size, 3), dtype=np.uint8)
 
     # Paste the resized image into the center of the new image
-    new_image[
-        (desired_size - new_size[0]) // 2 : (desired_size - new_size[0]) // 2
-        + new_size[0],
-        (desired_size - new_size[1]) // 2 : (desired_size - new_size[1]) // 2
-        + new_size[1],
-    ] = resized_image
+    new_image[top : top + new_size[0], left : left + new_size[1]] = resized_image
 
     return new_image
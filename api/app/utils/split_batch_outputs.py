@@ -0,0 +1,13 @@
+def split_batch_outputs(network_output, batch_size):
+    """
+    Splits the outputs of a batched YOLO forward pass into per-image layer outputs.
+
+    :param network_output: One array per YOLO layer, as returned by network.forward.
+    :param batch_size: Number of images in the input blob.
+    :return: List of length batch_size, each a list with one array per YOLO layer.
+    """
+    # YOLO layers return (rows, columns) for a single image and (batch, rows, columns) for more
+    layers = [
+        result.reshape(batch_size, -1, result.shape[-1]) for result in network_output
+    ]
+    return [[layer[i] for layer in layers] for i in range(batch_size)]
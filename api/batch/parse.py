@@ -0,0 +1,187 @@
+"""
+Parses every board photo of a directory or tar archive into a JSONL file, without the HTTP server.
+
+Run from the api directory:
+
+    python -m batch.parse photos/ -o results.jsonl
+    python -m batch.parse archive.tar.gz -o results.jsonl --workers 8 --resume
+    tar -c photos | python -m batch.parse - -o results.jsonl
+
+Images are fanned out over a pool of processes, each loading the networks once and parsing
+with a single OpenCV thread, so the pool as a whole keeps every core busy. One line is
+written per image as soon as it is parsed (in completion order), with the same fields as
+/parse/batch: the filename relative to the directory or archive, then checker_positions,
+dices and model, or an error.
+
+The output doubles as the checkpoint: with --resume, images already listed in it are
+skipped and new lines are appended, so an interrupted run picks up where it stopped. With
+--retry-errors failed images are parsed again, the last line of a filename is the one to keep.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from app.services.backgammon.GameParser import CASCADE
+from app.services.backgammon.ModelRegistry import DEFAULT_TIERS
+from . import worker
+from .sources import iter_images, directory_images
+
+APP_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Parse the board photos of a directory or tar archive.")
+    parser.add_argument("source", help="Directory, tar archive (optionally compressed) or - for a tar on stdin.")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file, one line per image.")
+    parser.add_argument("--tier", default="full", choices=list(DEFAULT_TIERS) + [CASCADE])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes.")
+    parser.add_argument("--threads", type=int, default=1, help="OpenCV threads per worker.")
+    parser.add_argument("--max-in-flight", type=int, default=0, help="Images queued at once, 0 = 4 per worker.")
+    parser.add_argument("--resume", action="store_true", help="Skip images already in the output and append.")
+    parser.add_argument("--retry-errors", action="store_true", help="With --resume, parse failed images again.")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="Seconds between progress lines.")
+    parser.add_argument("--rectified-size", type=int, default=0, help="Two-stage parsing input size (0 = off).")
+    parser.add_argument("--tile-grid", type=int, default=0, help="Tiles along the longest side (0 = off).")
+    return parser.parse_args(argv)
+
+
+def read_checkpoint(path, retry_errors=False):
+    """
+    :return: Filenames already parsed according to an earlier output.
+
+    A line cut short by an interrupted run is dropped from the file, so appending starts on
+    a fresh line.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, "rb+") as f:
+        content = f.read()
+        end = content.rfind(b"\n") + 1
+        if end < len(content):
+            f.truncate(end)
+
+    for raw in content[:end].splitlines():
+        try:
+            line = json.loads(raw)
+        except ValueError:
+            continue
+        if retry_errors and "error" in line:
+            continue
+        done.add(line["filename"])
+    return done
+
+
+class Progress:
+    """Periodic progress and throughput lines on stderr."""
+
+    def __init__(self, total, interval):
+        self.total = total
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.parsed = 0
+        self.errors = 0
+        self.skipped = 0
+
+    def update(self, line):
+        self.parsed += 1
+        self.errors += "error" in line
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now=None):
+        elapsed = (now or time.perf_counter()) - self.start
+        rate = self.parsed / elapsed if elapsed > 0 else 0.0
+
+        message = f"{self.parsed} parsed"
+        if self.total is not None:
+            remaining = self.total - self.skipped - self.parsed
+            message = f"{self.parsed}/{self.total - self.skipped} parsed"
+            if rate > 0:
+                message += f", {remaining / rate:.0f} s left"
+        message += f", {rate:.2f} images/s, {self.errors} errors"
+        if self.skipped:
+            message += f", {self.skipped} skipped"
+        print(message, file=sys.stderr, flush=True)
+
+
+def run(args):
+    done = read_checkpoint(args.output, args.retry_errors) if args.resume else set()
+
+    if os.path.isdir(args.source):
+        # Listing a directory is cheap, it gives the total for the progress lines
+        images = list(directory_images(args.source))
+        total = len(images)
+    else:
+        images = iter_images(args.source)
+        total = None
+
+    workers = max(args.workers, 1)
+    max_in_flight = args.max_in_flight or 4 * workers
+    parser_options = {"rectified_size": args.rectified_size, "tile_grid": args.tile_grid}
+
+    progress = Progress(total, args.progress_interval)
+    executor = ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=worker.initialize,
+        initargs=(APP_ROOT, args.tier, args.threads, parser_options),
+    )
+
+    with open(args.output, "a" if args.resume else "w") as output, executor:
+
+        def write(finished):
+            for future in finished:
+                line = future.result()
+                output.write(json.dumps(line) + "\n")
+                progress.update(line)
+            # Every written line is checkpointed, even if the run is killed right after
+            output.flush()
+
+        pending = set()
+        for name, path, data in images:
+            if name in done:
+                progress.skipped += 1
+                continue
+
+            # Bounded, so a large archive is never read into memory ahead of the workers
+            if len(pending) >= max_in_flight:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write(finished)
+            pending.add(executor.submit(worker.parse, name, path, data))
+
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            write(finished)
+
+    progress.report()
+    return progress
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    try:
+        run(args)
+    except (ValueError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    except BrokenProcessPool:
+        # A worker died, e.g. its networks failed to load
+        print("error: a worker process exited, see its traceback above", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        print("interrupted, run again with --resume to continue", file=sys.stderr)
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
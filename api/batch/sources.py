@@ -0,0 +1,53 @@
+import os
+import sys
+import tarfile
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def directory_images(root):
+    """
+    Yields (name relative to root, path, None) for every image under root, in sorted order
+    so that runs over the same directory list images identically.
+    """
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(files):
+            if is_image(filename):
+                path = os.path.join(directory, filename)
+                yield os.path.relpath(path, root), path, None
+
+
+def tar_images(path):
+    """
+    Yields (member name, None, encoded image) for every image of a tar archive.
+
+    The archive is read as a stream, compressed or not, so members are never seeked to and
+    archives larger than memory or piped from stdin ("-") work.
+    """
+    if path == "-":
+        archive = tarfile.open(fileobj=sys.stdin.buffer, mode="r|*")
+    else:
+        archive = tarfile.open(path, mode="r|*")
+
+    with archive:
+        for member in archive:
+            if member.isfile() and is_image(member.name):
+                yield member.name, None, archive.extractfile(member).read()
+
+
+def is_archive(path):
+    return path == "-" or (os.path.isfile(path) and tarfile.is_tarfile(path))
+
+
+def iter_images(source):
+    """(name, path or None, bytes or None) of every image of a directory or tar archive."""
+    if os.path.isdir(source):
+        return directory_images(source)
+    if is_archive(source):
+        return tar_images(source)
+    raise ValueError(f"{source} is neither a directory nor a tar archive")
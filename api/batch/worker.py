@@ -0,0 +1,52 @@
+import time
+import cv2
+from app.services.backgammon.GameParser import GameParser, CASCADE
+from app.services.backgammon.ImageInput import ImageInput
+from app.services.backgammon.ModelRegistry import ModelRegistry
+
+# Set once per worker process by initialize(), every task reuses the loaded networks
+parser = None
+tier = None
+
+
+def initialize(app_root, requested_tier, threads, parser_options):
+    """
+    Initializer of a pool process: loads the networks of the tier before the first task.
+
+    :param threads: OpenCV threads of this process, the pool already spreads over the cores.
+    """
+    global parser, tier
+    cv2.setNumThreads(threads)
+
+    tier = requested_tier
+    parser = GameParser(ModelRegistry(app_root), **parser_options)
+    for name in [parser.fast_tier, parser.accurate_tier] if tier == CASCADE else [tier]:
+        parser.registry.get_tier(name)
+    parser.registry.get_template()
+
+
+def parse(name, path, data):
+    """
+    Parses one image, read from `path` unless its bytes are given.
+
+    :return: JSON line of the image, with either checker_positions and dices or an error.
+    """
+    start = time.perf_counter()
+    line = {"filename": name}
+
+    try:
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+
+        game_data, model = parser.parse(ImageInput(data, target_size=parser.inputSize(tier)), tier)
+        if game_data is None:
+            line["error"] = "Unable to detect the game board."
+        else:
+            line["checker_positions"], line["dices"] = game_data
+            line["model"] = model
+    except Exception as e:
+        line["error"] = str(e)
+
+    line["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return line
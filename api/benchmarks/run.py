@@ -0,0 +1,247 @@
+"""
+Benchmarks the parsing pipeline on synthetic board photos.
+
+Run from the api directory:
+
+    python -m benchmarks.run --images 100
+    python -m benchmarks.run --update-baselines
+
+Boards are rendered from the template with random positions, dices and perspective warps,
+then parsed one by one as /parse would parse an upload. Forward passes use the tier's
+weights when they are present and the deterministic StubNetwork otherwise. Every stage
+timed by PipelineMetrics is reported as p50/p95/p99, next to the throughput and how many
+checkers ended up on the right point.
+
+Exits with status 1 when throughput or a stage's p95 is worse than the stored baseline by
+more than --tolerance, or when accuracy dropped. Timings only compare on the same hardware,
+so baselines are keyed by CPU model and count (next to network, tier and photo size) and
+kept in an untracked file: record one with --update-baselines on each machine, before a
+change and again after an intended slowdown. Runs without a baseline for their machine
+report the numbers and pass.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from collections import Counter
+import cv2
+import numpy as np
+from app.services.backgammon.GameParser import GameParser
+from app.services.backgammon.ImageInput import ImageInput
+from app.services.backgammon.ModelRegistry import ModelRegistry, DEFAULT_TIERS
+from app.services.backgammon.PipelineMetrics import METRICS, request_timings
+from .stub_network import StubNetwork
+from .synthetic_boards import generate_board
+
+APP_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# Report order, stages that never ran are left out
+STAGES = [
+    "decode", "preprocess", "forward", "yolo_decode", "nms",
+    "find_board", "homography", "point_lookup", "assign", "total",
+]
+
+# Stages of a few microseconds jitter by more than any sensible tolerance
+MIN_SLACK_MS = 0.5
+
+
+def machine_name():
+    """CPU model and count, e.g. "Intel(R) Xeon(R) CPU @ 2.20GHz x8"."""
+    model = platform.processor() or platform.machine()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    model = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return f"{model} x{os.cpu_count()}"
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the parsing pipeline on synthetic boards.")
+    parser.add_argument("--images", type=int, default=50, help="Boards timed.")
+    parser.add_argument("--warmup", type=int, default=3, help="Boards parsed before timing starts.")
+    parser.add_argument("--tier", default="full", choices=["full", "tiny"])
+    parser.add_argument("--size", type=int, default=2000, help="Longest side of the photos.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stub", action="store_true", help="Use the stub network even if weights exist.")
+    parser.add_argument("--threads", type=int, default=0, help="OpenCV threads, 0 keeps its default.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against baselines.")
+    parser.add_argument("--baselines", default=BASELINES_PATH)
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    parser.add_argument("--save", help="Directory to write the generated photos to.")
+    return parser.parse_args(argv)
+
+
+def score(board, game_data):
+    """
+    :return: (checkers on their true point, whether position and dices are exactly right)
+    """
+    if game_data is None:
+        return 0, False
+
+    checker_positions, dices = game_data
+    matched = 0
+    exact = True
+    for point, expected in board.checker_positions.items():
+        expected, parsed = Counter(expected), Counter(checker_positions.get(point, []))
+        matched += sum((expected & parsed).values())
+        exact = exact and expected == parsed
+
+    exact = exact and sorted(dice["value"] for dice in dices) == board.dices
+    return matched, exact
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "runs": len(samples),
+    }
+
+
+def run(args):
+    registry_options = {}
+    _, weights, _ = DEFAULT_TIERS[args.tier]
+    network = "weights"
+    stub = None
+    if args.stub or not os.path.exists(os.path.join(APP_ROOT, weights)):
+        network = "stub"
+        stub = StubNetwork(seed=args.seed)
+        registry_options["network_factory"] = lambda cfg_path, weights_path: stub
+
+    registry = ModelRegistry(APP_ROOT, **registry_options)
+    parser = GameParser(registry)
+    registry.get_tier(args.tier)
+    template = registry.get_template().image
+    target_size = parser.inputSize(args.tier)
+
+    rng = np.random.default_rng(args.seed)
+    boards = [generate_board(template, rng, size=args.size) for _ in range(args.warmup + args.images)]
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+        for i, board in enumerate(boards):
+            with open(os.path.join(args.save, f"board_{i:04d}.jpg"), "wb") as f:
+                f.write(board.data)
+
+    METRICS.enabled = True
+    samples = {}
+    matched = exact = checkers = 0
+    for i, board in enumerate(boards):
+        if stub is not None:
+            stub.expect(board.objects, board.shape)
+
+        timings, token = METRICS.track()
+        start = time.perf_counter()
+        try:
+            game_data, _ = parser.parse(ImageInput(board.data, target_size=target_size), args.tier)
+        finally:
+            elapsed = time.perf_counter() - start
+            request_timings.reset(token)
+
+        if i < args.warmup:
+            continue
+
+        for stage, seconds in list(timings.stages.items()) + [("total", elapsed)]:
+            samples.setdefault(stage, []).append(seconds)
+
+        board_matched, board_exact = score(board, game_data)
+        matched += board_matched
+        exact += board_exact
+        checkers += sum(len(stack) for stack in board.checker_positions.values())
+
+    return {
+        "key": f"{machine_name()}:{network}:{args.tier}:{args.size}",
+        "machine": machine_name(),
+        "network": network,
+        "tier": args.tier,
+        "images": args.images,
+        "images_per_second": round(args.images / sum(samples["total"]), 2),
+        "checker_accuracy": round(matched / checkers, 4),
+        "exact_positions": round(exact / args.images, 4),
+        "stages": {
+            stage: percentiles(samples[stage])
+            for stage in STAGES + sorted(set(samples) - set(STAGES))
+            if stage in samples
+        },
+    }
+
+
+def compare(result, baseline, tolerance):
+    """:return: Descriptions of everything worse than the baseline."""
+    failures = []
+
+    minimum = baseline["images_per_second"] * (1 - tolerance)
+    if result["images_per_second"] < minimum:
+        failures.append(f"throughput {result['images_per_second']} images/s < {minimum:.2f}")
+
+    for stage, stats in baseline["stages"].items():
+        current = result["stages"].get(stage)
+        limit = stats["p95_ms"] * (1 + tolerance) + MIN_SLACK_MS
+        if current is not None and current["p95_ms"] > limit:
+            failures.append(f"{stage} p95 {current['p95_ms']} ms > {limit:.3f} ms")
+
+    for name in ("checker_accuracy", "exact_positions"):
+        if result[name] < baseline[name]:
+            failures.append(f"{name} {result[name]} < {baseline[name]}")
+
+    return failures
+
+
+def report(result):
+    print(f"{result['images']} images, {result['network']} network, {result['tier']} tier on {result['machine']}")
+    print(f"{'stage':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'runs':>7}")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:<14}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}{stats['runs']:>7}")
+    print(f"throughput: {result['images_per_second']} images/s")
+    print(f"checkers on the right point: {result['checker_accuracy']:.2%}, exact positions: {result['exact_positions']:.2%}")
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    if args.threads:
+        cv2.setNumThreads(args.threads)
+
+    result = run(args)
+    report(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+
+    if args.update_baselines:
+        baselines[result["key"]] = {
+            name: result[name] for name in ("images_per_second", "checker_accuracy", "exact_positions", "stages")
+        }
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline {result['key']} written to {args.baselines}")
+        return 0
+
+    baseline = baselines.get(result["key"])
+    if baseline is None:
+        print(f"no baseline for {result['key']} on this machine, run with --update-baselines to record one")
+        return 0
+
+    failures = compare(result, baseline, args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
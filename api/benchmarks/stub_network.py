@@ -0,0 +1,89 @@
+import numpy as np
+from app.utils.resize_and_pad_image import get_letterbox_params
+
+# Strides of the YOLOv4 output layers, 3 anchors per grid cell
+STRIDES = (8, 16, 32)
+ANCHORS = 3
+
+
+class StubNetwork:
+    """
+    Deterministic stand-in for a cv2.dnn Darknet network, for benchmarks without weights.
+
+    forward() returns arrays shaped like the YOLO layers of a real network at the blob's
+    input size: every row is low objectness noise except the objects announced with
+    expect(), each with a couple of jittered duplicates for NMS to remove. Only the forward
+    pass itself is fake, decoding, NMS and everything after run on realistic outputs.
+    """
+
+    def __init__(self, num_classes=8, duplicates=2, seed=0):
+        self.num_classes = num_classes
+        self.duplicates = duplicates
+        self.seed = seed
+        self.blob = None
+        self.expected = []
+        self.noise = {}  # input size -> noise of every layer
+
+    def getLayerNames(self):
+        return [f"yolo_{stride}" for stride in STRIDES]
+
+    def getUnconnectedOutLayers(self):
+        return np.arange(1, len(STRIDES) + 1)
+
+    def setInput(self, blob):
+        self.blob = blob
+
+    def expect(self, objects, shape):
+        """
+        Announces what the next image holds.
+
+        :param objects: DETECTION_DTYPE rows in pixels of the original image.
+        :param shape: Shape of the original image.
+        """
+        self.expected.append((objects, shape))
+
+    def forward(self, layers):
+        batch_size, _, size, _ = self.blob.shape
+        images = [self.__image(size) for _ in range(batch_size)]
+        if batch_size == 1:
+            return tuple(images[0])
+        return tuple(np.stack(outputs) for outputs in zip(*images))
+
+    def __image(self, size):
+        # Fresh arrays, as a real forward pass allocates its outputs
+        outputs = [layer.copy() for layer in self.__noise(size)]
+        if not self.expected:
+            return outputs
+
+        objects, shape = self.expected.pop(0)
+        ratio, top, left = get_letterbox_params(shape, size)
+        rng = np.random.default_rng(self.seed + len(objects))
+
+        # Truth goes into the finest layer, where small objects are detected
+        rows = outputs[0]
+        indices = rng.choice(len(rows), len(objects) * (1 + self.duplicates), replace=False)
+        for i, detection in enumerate(np.repeat(objects, 1 + self.duplicates)):
+            x, y, width, height = detection["bbox"] * ratio + (left, top, 0, 0)
+            duplicate = i % (1 + self.duplicates)
+            jitter = rng.uniform(-0.05, 0.05, 4) * (width, height, width, height) if duplicate else 0
+            confidence = 0.95 - 0.1 * duplicate
+
+            row = rows[indices[i]]
+            row[:4] = (np.float32([x + width / 2, y + height / 2, width, height]) + jitter) / size
+            row[4] = confidence
+            row[5:] = 0
+            row[5 + detection["class_number"]] = confidence
+        return outputs
+
+    def __noise(self, size):
+        if size not in self.noise:
+            rng = np.random.default_rng(self.seed)
+            layers = []
+            for stride in STRIDES:
+                rows = (size // stride) ** 2 * ANCHORS
+                layer = rng.random((rows, 5 + self.num_classes), dtype=np.float32)
+                # Below any confidence threshold, but still scanned by decoding
+                layer[:, 4:] *= 0.05
+                layers.append(layer)
+            self.noise[size] = layers
+        return self.noise[size]
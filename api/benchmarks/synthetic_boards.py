@@ -0,0 +1,159 @@
+import cv2
+import numpy as np
+from app.services.backgammon.Class import Class
+from app.services.backgammon.Constants import POINT_BBOXS
+from app.services.backgammon.Detector import DETECTION_DTYPE
+
+CHECKER_RADIUS = 24
+MAX_STACK = 5
+DICE_SIDE = 36
+
+# Pip positions of each dice value, in fractions of the dice side
+DICE_PIPS = {
+    1: [(0.5, 0.5)],
+    2: [(0.25, 0.25), (0.75, 0.75)],
+    3: [(0.25, 0.25), (0.5, 0.5), (0.75, 0.75)],
+    4: [(0.25, 0.25), (0.75, 0.25), (0.25, 0.75), (0.75, 0.75)],
+    5: [(0.25, 0.25), (0.75, 0.25), (0.5, 0.5), (0.25, 0.75), (0.75, 0.75)],
+    6: [(0.25, 0.25), (0.75, 0.25), (0.25, 0.5), (0.75, 0.5), (0.25, 0.75), (0.75, 0.75)],
+}
+
+
+class SyntheticBoard:
+    """A rendered board photo and everything on it, in pixels of the encoded image."""
+
+    def __init__(self, data, shape, objects, checker_positions, dices, corners):
+        self.data = data
+        self.shape = shape
+        # DETECTION_DTYPE rows with confidence 1, what a perfect detector would return
+        self.objects = objects
+        self.checker_positions = checker_positions
+        self.dices = dices
+        self.corners = corners
+
+
+def stack_centers(point, template_height):
+    """Centers of the checkers stacked on a point (1-24), from the board edge inwards."""
+    bbox = np.float32(POINT_BBOXS[point - 1])
+    if point <= 12:
+        base, tip = (bbox[2] + bbox[3]) / 2, (bbox[0] + bbox[1]) / 2
+        base[1] = template_height
+    else:
+        base, tip = (bbox[0] + bbox[1]) / 2, (bbox[2] + bbox[3]) / 2
+        base[1] = 0
+
+    direction = (tip - base) / np.linalg.norm(tip - base)
+    return [base + direction * CHECKER_RADIUS * (1 + 2 * k) for k in range(MAX_STACK)]
+
+
+def random_position(rng):
+    """
+    15 checkers per player on distinct points, at most MAX_STACK per point.
+
+    Player 1 always holds point 13 and player 2 point 1: their first checkers sit in two
+    opposite corners of the board, which is where BackgammonCV.findBoard takes the board from.
+    """
+    points = [p for p in range(2, 25) if p != 13]
+    rng.shuffle(points)
+
+    positions = {str(i): [] for i in range(1, 26)}
+    for player, anchor in (("player_1", 13), ("player_2", 1)):
+        owned = [anchor] + [points.pop() for _ in range(int(rng.integers(3, 7)))]
+        for _ in range(15):
+            free = [p for p in owned if len(positions[str(p)]) < MAX_STACK]
+            positions[str(free[int(rng.integers(len(free)))])].append(player)
+    return positions
+
+
+def render_board(template, positions, dice_values, rng):
+    """
+    Draws checkers and dices on the template.
+
+    :return: (board image, [(class number, template space polygon, template space center)])
+    """
+    board = template.copy()
+    height, width = board.shape[:2]
+    objects = []
+
+    for point in range(1, 25):
+        checkers = positions[str(point)]
+        centers = stack_centers(point, height)
+        for k, player in enumerate(checkers):
+            center = centers[k]
+            if k == 0 and point in (1, 13):
+                # Corner anchors, so the board spans exactly the template
+                center = np.float32([CHECKER_RADIUS, CHECKER_RADIUS] if point == 13
+                                    else [width - CHECKER_RADIUS, height - CHECKER_RADIUS])
+
+            white = player == "player_1"
+            x, y = center.round().astype(int)
+            cv2.circle(board, (x, y), CHECKER_RADIUS, (235, 235, 235) if white else (25, 25, 25), -1, cv2.LINE_AA)
+            cv2.circle(board, (x, y), CHECKER_RADIUS, (120, 120, 120), 2, cv2.LINE_AA)
+
+            extremes = center + np.float32([(-1, 0), (1, 0), (0, -1), (0, 1)]) * CHECKER_RADIUS
+            objects.append((Class.DISK_WHITE if white else Class.DISK_BLACK, extremes, center))
+
+    # Dices in the gap between the rows, on the right half of the board
+    gap = (POINT_BBOXS[23][2][1] + POINT_BBOXS[0][0][1]) / 2
+    slots = rng.choice(np.arange(560, width - 2 * DICE_SIDE, 2 * DICE_SIDE), len(dice_values), replace=False)
+    for value, x in zip(dice_values, slots):
+        top_left = np.float32([x, gap - DICE_SIDE / 2])
+        corners = top_left + np.float32([(0, 0), (1, 0), (1, 1), (0, 1)]) * DICE_SIDE
+        cv2.fillConvexPoly(board, corners.round().astype(np.int32), (245, 245, 245), cv2.LINE_AA)
+        for px, py in DICE_PIPS[value]:
+            pip = (top_left + np.float32([px, py]) * DICE_SIDE).round().astype(int)
+            cv2.circle(board, tuple(pip.tolist()), 3, (0, 0, 0), -1, cv2.LINE_AA)
+        objects.append((Class.DICE_1 + value - 1, corners, top_left + DICE_SIDE / 2))
+
+    return board, objects
+
+
+def generate_board(template, rng, size=2000, max_skew=0.03, quality=90):
+    """
+    Renders one random position under a random perspective warp and encodes it as a JPEG.
+
+    :param template: BGR board template.
+    :param size: Longest side of the photo, 4:3.
+    :param max_skew: Largest corner displacement, as a fraction of the board width.
+    :return: SyntheticBoard.
+    """
+    positions = random_position(rng)
+    dice_values = rng.integers(1, 7, size=2).tolist()
+    board, board_objects = render_board(template, positions, dice_values, rng)
+
+    height, width = board.shape[:2]
+    photo_width, photo_height = size, size * 3 // 4
+
+    # Board over 60-80% of the photo width, somewhere in the frame, corners pushed around
+    scale = rng.uniform(0.6, 0.8) * photo_width / width
+    board_width, board_height = width * scale, height * scale
+    origin = np.float32([
+        rng.uniform(0.1, 0.9) * (photo_width - board_width),
+        rng.uniform(0.1, 0.9) * (photo_height - board_height),
+    ])
+    corners = origin + np.float32([(0, 0), (board_width, 0), (board_width, board_height), (0, board_height)])
+    corners += rng.uniform(-max_skew, max_skew, size=(4, 2)).astype(np.float32) * board_width
+
+    template_corners = np.float32([(0, 0), (width, 0), (width, height), (0, height)])
+    matrix = cv2.getPerspectiveTransform(template_corners, corners)
+
+    background = np.empty((photo_height, photo_width, 3), dtype=np.uint8)
+    background[:] = rng.integers(40, 200, size=3)
+    noise = rng.normal(0, 6, size=(photo_height // 8, photo_width // 8, 3)).astype(np.float32)
+    background = cv2.add(background, cv2.resize(noise, (photo_width, photo_height)), dtype=cv2.CV_8U)
+    photo = cv2.warpPerspective(
+        board, matrix, (photo_width, photo_height), dst=background, borderMode=cv2.BORDER_TRANSPARENT
+    )
+
+    objects = np.empty(len(board_objects), dtype=DETECTION_DTYPE)
+    for i, (class_number, polygon, center) in enumerate(board_objects):
+        warped = cv2.perspectiveTransform(polygon.reshape((-1, 1, 2)), matrix).reshape((-1, 2))
+        x_min, y_min = warped.min(axis=0)
+        x_max, y_max = warped.max(axis=0)
+        objects[i] = (class_number, 1.0, (x_min, y_min, x_max - x_min, y_max - y_min), (0, 0))
+    objects["center"] = objects["bbox"][:, :2] + objects["bbox"][:, 2:] // 2
+
+    _, buffer = cv2.imencode(".jpg", photo, [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+    dices = sorted(dice_values)
+    return SyntheticBoard(buffer.tobytes(), photo.shape, objects, positions, dices, corners.tolist())